@@ -5,16 +5,71 @@
 import math
 
 
-def draw_line(p_list, algorithm):
+class _LRUCache:
+    """按缓存内容的总大小限制容量的LRU缓存（本文件只允许依赖math库，故不使用functools.lru_cache）"""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.size = 0
+        self.data = {}  # dict保持插入顺序，最久未使用的在最前面
+
+    def get(self, key):
+        entry = self.data.pop(key, None)
+        if entry is None:
+            return None
+        self.data[key] = entry
+        return entry[0]
+
+    def put(self, key, value, size):
+        """放入缓存；比整个容量还大的内容不缓存，也不淘汰已有的内容"""
+        old = self.data.pop(key, None)
+        if old is not None:
+            self.size -= old[1]
+        if size > self.capacity:
+            return
+        while self.data and self.size + size > self.capacity:
+            self.size -= self.data.pop(next(iter(self.data)))[1]
+        self.data[key] = (value, size)
+        self.size += size
+
+    def resize(self, capacity):
+        """修改容量，超出新容量的最久未使用的内容立即被淘汰"""
+        self.capacity = capacity
+        while self.data and self.size > capacity:
+            self.size -= self.data.pop(next(iter(self.data)))[1]
+
+    def clear(self):
+        self.data.clear()
+        self.size = 0
+
+
+_bezier_basis_cache = _LRUCache(1 << 21)  # 容量按缓存的基函数值个数计
+_bspline_basis_cache = _LRUCache(1 << 21)
+CURVE_FLATNESS = 0.25  # 自适应采样时允许的控制多边形到弦的最大距离（像素）
+ELLIPSE_EXACT_RADIUS = 1 << 15  # 半径小于该值时中点椭圆算法的浮点运算都是精确的，裁剪时可以直接跳到可见的部分
+ELLIPSE_TEMPLATE_CACHE_SIZE = 1 << 21  # 椭圆模板缓存的默认容量，按缓存的整数个数计
+_ellipse_template_cache = _LRUCache(ELLIPSE_TEMPLATE_CACHE_SIZE)
+DDA_CHECKPOINT_STRIDE = 256  # 裁剪DDA线段时每累加这么多步记录一次累加值，同一线段再次裁剪时从最近的记录继续累加
+_dda_checkpoint_cache = _LRUCache(1 << 18)  # 容量按记录的累加值个数计
+
+
+def draw_line(p_list, algorithm, clip_rect=None, spans=False):
     """绘制线段
 
     :param p_list: (list of list of int: [[x0, y0], [x1, y1]]) 线段的起点和终点坐标
     :param algorithm: (string) 绘制使用的算法，包括'DDA'和'Bresenham'，此处的'Naive'仅作为示例，测试时不会出现
+    :param clip_rect: (tuple of int: (x_min, y_min, x_max, y_max)) 可选的裁剪矩形（含边界），给定时只生成矩形内的像素，
+                      结果与不裁剪时的结果中落在矩形内的像素按相同顺序排列，计算量与可见的像素个数成正比
+    :param spans: (bool) 为True时返回水平像素段[[y, x_start, x_end], ...]（含两端），所含像素与逐像素的结果相同
     :return: (list of list of int: [[x_0, y_0], [x_1, y_1], [x_2, y_2], ...]) 绘制结果的像素点坐标列表
     """
     # print("draw", p_list)
     x0, y0 = p_list[0]
     x1, y1 = p_list[1]
+    if spans:
+        return _line_spans(x0, y0, x1, y1, algorithm, clip_rect)
+    if clip_rect is not None:
+        return _draw_line_clipped(x0, y0, x1, y1, algorithm, clip_rect)
     result = []
     if algorithm == 'Naive':
         # print(x0,x1,y0,y1)
@@ -93,24 +148,310 @@ def draw_line(p_list, algorithm):
     return result
 
 
-def draw_polygon(p_list, algorithm):
+def _draw_line_clipped(x0, y0, x1, y1, algorithm, clip_rect):
+    # 先求出主方向上可能可见的步数区间，只在该区间内按原算法步进：
+    # Naive和Bresenham的第i步可以直接算出，DDA的浮点累加与累加顺序有关，跳过的步数只做累加、不生成像素
+    x_min, y_min, x_max, y_max = clip_rect
+    result = []
+    if max(x0, x1) < x_min or min(x0, x1) > x_max or max(y0, y1) < y_min or min(y0, y1) > y_max:
+        return result
+    if algorithm == 'Naive':
+        if x0 == x1:
+            for y in range(max(y0, y_min), min(y1, y_max) + 1):
+                result.append((x0, y))
+        else:
+            if x0 > x1:
+                x0, y0, x1, y1 = x1, y1, x0, y0
+            k = (y1 - y0) / (x1 - x0)
+            steps = _visible_steps(x0, 1, y0, k, x1 - x0 + 1, clip_rect, True)
+            if steps is not None:
+                for x in range(x0 + steps[0], x0 + steps[1] + 1):
+                    y = int(y0 + k * (x - x0))
+                    if y_min <= y <= y_max:
+                        result.append((x, y))
+    elif algorithm == 'DDA':
+        if x0 == x1:
+            for y in range(max(min(y0, y1), y_min), min(max(y0, y1), y_max) + 1):
+                result.append((x0, y))
+            return result
+        k = (y1 - y0) / (x1 - x0)
+        if k == 0:
+            for x in range(max(min(x0, x1), x_min), min(max(x0, x1), x_max) + 1):
+                result.append((x, y0))
+            return result
+        x_major = abs(k) <= 1
+        if x_major:
+            sign = 1 if x1 >= x0 else -1
+            m0, m1, c, k = x0, x1, y0, k
+        else:
+            sign = 1 if y1 >= y0 else -1
+            m0, m1, c, k = y0, y1, x0, 1 / k
+        steps = _visible_steps(m0, sign, c, k * sign, abs(m1 - m0) + 1, clip_rect, x_major)
+        if steps is None:
+            return result
+        first, last = steps
+        c = _dda_skip(c, k, sign, first)
+        for m in range(m0 + sign * first, m0 + sign * (last + 1), sign):
+            if x_major:
+                x, y = m, round(c)
+            else:
+                x, y = round(c), m
+            if x_min <= x <= x_max and y_min <= y <= y_max:
+                result.append((x, y))
+            if sign > 0:
+                c += k
+            else:
+                c -= k
+    elif algorithm == 'Bresenham':
+        dx = abs(x1 - x0)
+        dy = abs(y1 - y0)
+        sx = 1 if x0 < x1 else -1
+        sy = 1 if y0 < y1 else -1
+        x_major = dy < dx
+        if x_major:
+            d_major, d_minor, s_major, s_minor, m0, c0 = dx, dy, sx, sy, x0, y0
+        else:
+            d_major, d_minor, s_major, s_minor, m0, c0 = dy, dx, sy, sx, y0, x0
+        steps = _visible_steps(m0, s_major, c0, s_minor * d_minor / max(d_major, 1), d_major + 1, clip_rect, x_major)
+        if steps is None:
+            return result
+        first, last = steps
+        # 前i步中沿次方向走过的步数j = ceil((2 * d_minor * i - d_major) / (2 * d_major))，决策参数随之确定
+        j = -((d_major - 2 * d_minor * first) // max(2 * d_major, 1))
+        p = 2 * d_minor - d_major + 2 * d_minor * first - 2 * d_major * j
+        m, c = m0 + s_major * first, c0 + s_minor * j
+        for _ in range(first, last + 1):
+            x, y = (m, c) if x_major else (c, m)
+            if x_min <= x <= x_max and y_min <= y <= y_max:
+                result.append((x, y))
+            if p > 0:
+                c += s_minor
+                p += 2 * (d_minor - d_major)
+            else:
+                p += 2 * d_minor
+            m += s_major
+    return result
+
+
+def _dda_skip(c, k, sign, steps):
+    """返回DDA算法从c开始步进steps步后的累加值，与原算法相同，反向步进（sign < 0）时每步减去k而不是加上-k
+
+    浮点累加与累加顺序有关，无法直接算出第i步的值。同一线段分块渲染时会以不同的裁剪矩形反复光栅化，
+    因此每隔DDA_CHECKPOINT_STRIDE步把累加值记录下来，之后从不超过steps的最近一次记录继续累加，
+    跳过的总计算量与线段长度而不是与光栅化次数成正比
+    """
+    if steps < DDA_CHECKPOINT_STRIDE:
+        if sign > 0:
+            for _ in range(steps):
+                c += k
+        else:
+            for _ in range(steps):
+                c -= k
+        return c
+    key = (c, k, sign)
+    marks = _dda_checkpoint_cache.get(key) or [c]  # marks[j]为步进j * DDA_CHECKPOINT_STRIDE步后的累加值
+    j = min(steps // DDA_CHECKPOINT_STRIDE, len(marks) - 1)
+    c = marks[j]
+    grown = len(marks)
+    for j in range(j, steps // DDA_CHECKPOINT_STRIDE):
+        if sign > 0:
+            for _ in range(DDA_CHECKPOINT_STRIDE):
+                c += k
+        else:
+            for _ in range(DDA_CHECKPOINT_STRIDE):
+                c -= k
+        marks.append(c)
+    if len(marks) != grown:
+        _dda_checkpoint_cache.put(key, marks, len(marks))
+    if sign > 0:
+        for _ in range(steps % DDA_CHECKPOINT_STRIDE):
+            c += k
+    else:
+        for _ in range(steps % DDA_CHECKPOINT_STRIDE):
+            c -= k
+    return c
+
+
+def _line_spans(x0, y0, x1, y1, algorithm, clip_rect):
+    # 水平线、竖直线（各算法的结果都是两端点之间的整行或整列）和Bresenham算法的线段直接按行求出像素段，
+    # 不逐个生成像素；其余情况逐像素生成后合并
+    x_min, y_min, x_max, y_max = clip_rect if clip_rect is not None else (-math.inf, -math.inf, math.inf, math.inf)
+    dx, dy = abs(x1 - x0), abs(y1 - y0)
+    result = []
+    if algorithm not in ('Naive', 'DDA', 'Bresenham'):
+        return result
+    if dy == 0:
+        x_start, x_end = max(min(x0, x1), x_min), min(max(x0, x1), x_max)
+        if y_min <= y0 <= y_max and x_start <= x_end:
+            result.append([y0, x_start, x_end])
+        return result
+    if dx == 0 and algorithm != 'Bresenham':
+        # Naive算法的竖直线只在y0 <= y1时有像素，与draw_line相同
+        if x_min <= x0 <= x_max and (algorithm == 'DDA' or y0 <= y1):
+            for y in range(max(min(y0, y1), y_min), min(max(y0, y1), y_max) + 1):
+                result.append([y, x0, x0])
+        return result
+    if algorithm != 'Bresenham':
+        return pixel_spans(draw_line([[x0, y0], [x1, y1]], algorithm, clip_rect))
+    sx = 1 if x0 < x1 else -1
+    sy = 1 if y0 < y1 else -1
+    j_lo, j_hi = (y_min - y0, y_max - y0) if sy > 0 else (y0 - y_max, y0 - y_min)
+    if dy >= dx:
+        # y主方向：第j步（即第j行）沿x方向走过的步数为ceil((2 * dx * j - dy) / (2 * dy))，每行一个像素
+        for j in range(max(j_lo, 0), min(j_hi, dy) + 1):
+            x = x0 - sx * ((dy - 2 * dx * j) // (2 * dy))
+            if x_min <= x <= x_max:
+                result.append([y0 + sy * j, x, x])
+        return result
+    # x主方向：第i步沿y方向走过的步数为ceil((2 * dy * i - dx) / (2 * dx))，因此第j行的像素为第
+    # floor((2 * dx * (j - 1) + dx) / (2 * dy)) + 1步到第floor((2 * dx * j + dx) / (2 * dy))步
+    for j in range(max(j_lo, 0), min(j_hi, dy) + 1):
+        i_lo = max((2 * dx * (j - 1) + dx) // (2 * dy) + 1, 0)
+        i_hi = min((2 * dx * j + dx) // (2 * dy), dx)
+        x_start, x_end = x0 + sx * i_lo, x0 + sx * i_hi
+        if sx < 0:
+            x_start, x_end = x_end, x_start
+        x_start, x_end = max(x_start, x_min), min(x_end, x_max)
+        if x_start <= x_end:
+            result.append([y0 + sy * j, x_start, x_end])
+    return result
+
+
+def pixel_spans(pixels):
+    """把按生成顺序排列的像素点合并为水平像素段：同一行上与当前段相邻或重叠的连续像素并入当前段
+
+    :param pixels: (list of list of int: [[x_0, y_0], [x_1, y_1], ...]) 像素点坐标列表
+    :return: (list of list of int: [[y, x_start, x_end], ...]) 水平像素段（含两端），所含像素与pixels相同
+    """
+    result = []
+    if not pixels:
+        return result
+    x_start, y_span = pixels[0]
+    x_end = x_start
+    for x, y in pixels:
+        if y == y_span and x_start - 1 <= x <= x_end + 1:
+            if x < x_start:
+                x_start = x
+            elif x > x_end:
+                x_end = x
+        else:
+            result.append([y_span, x_start, x_end])
+            x_start = x_end = x
+            y_span = y
+    result.append([y_span, x_start, x_end])
+    return result
+
+
+def _visible_steps(m0, m_step, c0, c_step, count, clip_rect, x_major):
+    """线段第i步（0 <= i < count）的像素主方向坐标为m0 + m_step * i，次方向坐标与c0 + c_step * i相差小于1，
+    返回两个坐标都可能落在裁剪矩形内的步数区间(first, last)，没有时返回None"""
+    x_min, y_min, x_max, y_max = clip_rect
+    m_range, c_range = ((x_min, x_max), (y_min, y_max)) if x_major else ((y_min, y_max), (x_min, x_max))
+    first, last = 0, count - 1
+    for start, step, (low, high), margin in ((m0, m_step, m_range, 0), (c0, c_step, c_range, 1)):
+        if step == 0:
+            if not low - margin <= start <= high + margin:
+                return None
+            continue
+        a, b = (low - margin - start) / step, (high + margin - start) / step
+        if a > b:
+            a, b = b, a
+        first = max(first, math.floor(a) - margin)
+        last = min(last, math.ceil(b) + margin)
+    return (first, last) if first <= last else None
+
+
+def draw_polygon(p_list, algorithm, clip_rect=None, spans=False):
     """绘制多边形
 
     :param p_list: (list of list of int: [[x0, y0], [x1, y1], [x2, y2], ...]) 多边形的顶点坐标列表
     :param algorithm: (string) 绘制使用的算法，包括'DDA'和'Bresenham'
+    :param clip_rect: (tuple of int: (x_min, y_min, x_max, y_max)) 可选的裁剪矩形（含边界），逐条边裁剪，含义同draw_line
+    :param spans: (bool) 为True时返回各条边的水平像素段，含义同draw_line
     :return: (list of list of int: [[x_0, y_0], [x_1, y_1], [x_2, y_2], ...]) 绘制结果的像素点坐标列表
     """
     result = []
     for i in range(len(p_list)):
-        line = draw_line([p_list[i - 1], p_list[i]], algorithm)
+        line = draw_line([p_list[i - 1], p_list[i]], algorithm, clip_rect, spans)
         result += line
     return result
 
 
-def draw_ellipse(p_list):
+def fill_polygon(p_list, rule, clip_rect=None):
+    """扫描线填充多边形（边表 + 活性边表），填充像素中心落在多边形内部的像素，支持凹多边形和自相交多边形
+
+    :param p_list: (list of list of int: [[x0, y0], [x1, y1], [x2, y2], ...]) 多边形的顶点坐标列表
+    :param rule: (string) 判断内部的规则，包括'Even-Odd'（奇偶规则）和'Non-Zero'（非零环绕数规则），
+                 与其他绘制函数遇到不认识的算法时相同，其他规则不填充任何像素
+    :param clip_rect: (tuple of int: (x_min, y_min, x_max, y_max)) 可选的裁剪矩形（含边界），只生成矩形内的像素段
+    :return: (list of list of int: [[y, x_start, x_end], ...]) 按y、x排序的水平像素段，每段为第y行x_start到x_end（含）的像素
+    """
+    if rule not in ('Even-Odd', 'Non-Zero'):
+        return []
+    # 边表：每条非水平边覆盖扫描线y_low <= y < y_high（下端点不计入，顶点处的交点不会重复计算），
+    # 按y_low排序；环绕方向按原来的顶点顺序，向y增大方向的边为+1
+    edges = []
+    for i in range(len(p_list)):
+        (xa, ya), (xb, yb) = p_list[i - 1], p_list[i]
+        if ya == yb:
+            continue
+        winding = 1 if yb > ya else -1
+        if ya > yb:
+            xa, ya, xb, yb = xb, yb, xa, ya
+        edges.append((ya, yb, xa, xb - xa, yb - ya, winding))
+    if not edges:
+        return []
+    edges.sort(key=lambda edge: edge[0])
+    y, y_end = edges[0][0], max(edge[1] for edge in edges)
+    x_min, x_max = -math.inf, math.inf
+    if clip_rect is not None:
+        x_min, y_min, x_max, y_max = clip_rect
+        y, y_end = max(y, y_min), min(y_end, y_max + 1)
+    even_odd = rule == 'Even-Odd'
+    # 活性边表：[y_high, num, dx, dy, winding]，交点x = num / dy，num为整数，每条扫描线加dx，没有浮点误差
+    active = []
+    result = []
+    i = 0
+    while y < y_end:
+        active = [edge for edge in active if edge[0] > y]
+        while i < len(edges) and edges[i][0] <= y:
+            y_low, y_high, x_low, dx, dy, winding = edges[i]
+            if y_high > y:
+                active.append([y_high, x_low * dy + (y - y_low) * dx, dx, dy, winding])
+            i += 1
+        if not active:
+            if i == len(edges):
+                break
+            y = edges[i][0]
+            continue
+        # 像素中心在交点右侧（含交点）的第一个像素为ceil(num / dy)，两个交点之间的像素为[ceil(左), ceil(右) - 1]
+        crossings = sorted((-(-edge[1] // edge[3]), edge[4]) for edge in active)
+        count = 0
+        start = 0
+        for x, winding in crossings:
+            inside = count != 0
+            count = count ^ 1 if even_odd else count + winding
+            if not inside and count != 0:
+                start = x
+            elif inside and count == 0:
+                x_start, x_end = max(start, x_min), min(x - 1, x_max)
+                if x_start <= x_end:
+                    if result and result[-1][0] == y and result[-1][2] + 1 >= x_start:
+                        result[-1][2] = x_end
+                    else:
+                        result.append([y, x_start, x_end])
+        for edge in active:
+            edge[1] += edge[2]
+        y += 1
+    return result
+
+
+def draw_ellipse(p_list, clip_rect=None, spans=False):
     """绘制椭圆（采用中点圆生成算法）
 
     :param p_list: (list of list of int: [[x0, y0], [x1, y1]]) 椭圆的矩形包围框左上角和右下角顶点坐标
+    :param clip_rect: (tuple of int: (x_min, y_min, x_max, y_max)) 可选的裁剪矩形（含边界），含义同draw_line
+    :param spans: (bool) 为True时返回水平像素段，含义同draw_line；第一象限同一行的像素先合并成一段，再对称到四个象限
     :return: (list of list of int: [[x_0, y_0], [x_1, y_1], [x_2, y_2], ...]) 绘制结果的像素点坐标列表
     """
     # print("draw_ellipse", p_list)
@@ -123,15 +464,135 @@ def draw_ellipse(p_list):
     result = []
     xc, yc = int((x0 + x1) / 2), int((y0 + y1) / 2)
     rx, ry = x1 - xc, y0 - yc
+    # 像素不超出包围框向外一个像素的范围，整个椭圆都在裁剪矩形内时与不裁剪相同
+    inside = clip_rect is None or (clip_rect[0] < xc - rx and xc + rx < clip_rect[2]
+                                   and clip_rect[1] < yc - ry and yc + ry < clip_rect[3])
+    template = _ellipse_template(rx, ry) if inside else _ellipse_template_cache.get((rx, ry))
+    if template is None:
+        # 椭圆只有一部分可见且没有缓存的模板时只计算可见的部分，不生成模板
+        quadrant = _ellipse_quadrant_clipped(xc, yc, rx, ry, clip_rect)
+        if spans:
+            return _mirror_spans(pixel_spans(quadrant), xc, yc, clip_rect)
+        for x, y in quadrant:
+            _append_symmetric(result, xc, yc, x, y, clip_rect)
+        return result
+    points, runs = template
+    if spans:
+        it = iter(runs)
+        if inside:
+            return [[yc + y, xc + x_start, xc + x_end] for y, x_start, x_end in zip(it, it, it)]
+        x_min, y_min, x_max, y_max = clip_rect
+        for y, x_start, x_end in zip(it, it, it):
+            y, x_start, x_end = yc + y, max(xc + x_start, x_min), min(xc + x_end, x_max)
+            if y_min <= y <= y_max and x_start <= x_end:
+                result.append([y, x_start, x_end])
+        return result
+    it = iter(points)
+    if inside:
+        for x, y in zip(it, it):
+            result.append((xc + x, yc + y))
+            result.append((xc - x, yc + y))
+            result.append((xc - x, yc - y))
+            result.append((xc + x, yc - y))
+        return result
+    # 第一象限的像素x单调不减、y单调不增，四个对称点中至少一个可见的像素与_ellipse_quadrant_clipped生成的相同
+    ax, ay = _mirror_range(clip_rect[0] - xc, clip_rect[2] - xc), _mirror_range(clip_rect[1] - yc, clip_rect[3] - yc)
+    if ax is None or ay is None:
+        return result
+    for x, y in zip(it, it):
+        if ax[0] <= x <= ax[1] and ay[0] <= y <= ay[1]:
+            _append_symmetric(result, xc, yc, x, y, clip_rect)
+    return result
+
+
+def set_ellipse_template_cache_size(size):
+    """设置椭圆模板缓存的容量（按缓存的整数个数计），为0时不缓存"""
+    _ellipse_template_cache.resize(size)
+
+
+def clear_caches():
+    """清空本模块的所有缓存（曲线基函数、椭圆模板、DDA累加值的记录），之后的调用都从头计算，用于测量冷启动的开销"""
+    _bezier_basis_cache.clear()
+    _bspline_basis_cache.clear()
+    _ellipse_template_cache.clear()
+    _dda_checkpoint_cache.clear()
+
+
+def _ellipse_template(rx, ry):
+    """半径为(rx, ry)的椭圆的模板：按生成顺序排列的第一象限的像素，以及整个椭圆的水平像素段（均相对中心），
+    分别展平为整数元组(x0, y0, x1, y1, ...)和(y0, x_start0, x_end0, ...)。像素只取决于半径，中心只是整体平移，
+    因此按半径缓存，大量同样大小的椭圆只计算一次"""
+    key = (rx, ry)
+    template = _ellipse_template_cache.get(key)
+    if template is None:
+        quadrant = _ellipse_quadrant(rx, ry)
+        points = tuple(c for point in quadrant for c in point)
+        runs = tuple(c for run in _mirror_spans(pixel_spans(quadrant), 0, 0, None) for c in run)
+        template = (points, runs)
+        _ellipse_template_cache.put(key, template, len(points) + len(runs))
+    return template
+
+
+def _ellipse_quadrant(rx, ry):
+    """中点椭圆算法，按生成顺序返回第一象限（相对中心）的像素"""
+    result = []
+    rx2 = rx ** 2
+    ry2 = ry ** 2
+    x, y = 0, ry
+    p = ry2 + rx2 / 4 - rx2 * ry
+    while ry2 * x < rx2 * y:
+        result.append((x, y))
+        x += 1
+        if p < 0:
+            p = p + 2 * ry2 * x + ry2
+        else:
+            y -= 1
+            p = p + 2 * ry2 * x + ry2 - 2 * rx2 * y
+    p = ry2 * (x + 1 / 2) ** 2 + rx2 * (y - 1) ** 2 - rx2 * ry2
+    while y >= 0:
+        result.append((x, y))
+        y -= 1
+        if p > 0:
+            p = p - 2 * rx2 * y + rx2
+        else:
+            x += 1
+            p = p + 2 * ry2 * x - 2 * rx2 * y + rx2
+    return result
+
+
+def _ellipse_quadrant_clipped(xc, yc, rx, ry, clip_rect):
+    """按生成顺序返回第一象限（相对中心）中四个对称点至少有一个在裁剪矩形内的像素"""
+    # 第一象限的像素(x, y)沿区域1、区域2依次生成，x单调不减、y单调不增，四个对称点中至少一个可见当且仅当
+    # |x|落在ax_lo..ax_hi内且|y|落在ay_lo..ay_hi内，因此可见的步是连续的一段：跳到第一个可见的步，
+    # 离开可见范围后直接结束。
+    # 决策参数p恰好等于椭圆方程在中点处的值（区域2再加上初值计算时的舍入误差e），半径不太大时各步的浮点运算都是精确的，
+    # 只要像素每步最多移动一格，第x列（或第y行）的像素就可以直接由整数开方求出，与逐步递推的结果完全相同
+    x_min, y_min, x_max, y_max = clip_rect
+    quadrant = []
+    ax, ay = _mirror_range(x_min - xc, x_max - xc), _mirror_range(y_min - yc, y_max - yc)
+    if ax is None or ay is None:
+        return quadrant
+    ax_lo, ax_hi = ax
+    ay_lo, ay_hi = ay
+    exact = 0 < rx < ELLIPSE_EXACT_RADIUS and 0 < ry < ELLIPSE_EXACT_RADIUS
     rx2 = rx ** 2
     ry2 = ry ** 2
     x, y = 0, ry
     p = ry2 + rx2 / 4 - rx2 * ry
+    if exact:
+        # 跳到同时满足x >= ax_lo、y <= ay_hi的第一列，但不超过像素每步最多下降一格的范围
+        t = 4 * rx2 * ry2 - rx2 * (2 * ay_hi + 1) ** 2
+        target = max(ax_lo, 0 if t <= 0 else math.isqrt(-(-t // (4 * ry2)) - 1) + 1)
+        target = min(target, _ellipse_safe_step(rx, ry, 0))
+        row = _ellipse_row(rx2, ry2, target)
+        if target > 0 and row is not None and ry2 * target < rx2 * row:
+            x, y = target, row
+            p = (4 * ry2 * (x + 1) ** 2 + rx2 * (2 * y - 1) ** 2 - 4 * rx2 * ry2) / 4
     while ry2 * x < rx2 * y:
-        result.append([x, y])
-        result.append([-x, y])
-        result.append([-x, -y])
-        result.append([x, -y])
+        if x > ax_hi or y < ay_lo:
+            return quadrant
+        if x >= ax_lo and y <= ay_hi:
+            quadrant.append((x, y))
         x += 1
         if p < 0:
             p = p + 2 * ry2 * x + ry2
@@ -139,83 +600,354 @@ def draw_ellipse(p_list):
             y -= 1
             p = p + 2 * ry2 * x + ry2 - 2 * rx2 * y
     p = ry2 * (x + 1 / 2) ** 2 + rx2 * (y - 1) ** 2 - rx2 * ry2
+    target = None
+    if exact:
+        # 区域2的初值含有半径的四次方，可能有舍入误差e，之后的递推都是精确的，相当于把椭圆方程整体平移了e
+        e4 = int(p * 4) - (ry2 * (2 * x + 1) ** 2 + 4 * rx2 * (y - 1) ** 2 - 4 * rx2 * ry2)
+        safe = _ellipse_safe_step(ry, rx, e4)
+        target = ay_hi
+        if ax_lo > 0:
+            q = 4 * rx2 * ry2 - e4 - ry2 * (2 * ax_lo - 1) ** 2
+            target = min(target, math.isqrt(q // (4 * rx2)) if q >= 0 else -1)
     while y >= 0:
-        result.append([x, y])
-        result.append([-x, y])
-        result.append([-x, -y])
-        result.append([x, -y])
+        if x > ax_hi or y < ay_lo:
+            return quadrant
+        if target is not None and target < y <= safe and x == _ellipse_column(rx2, ry2, y, e4):
+            # 区域2开始时的x不一定恰好在第y行的理想位置上，追上之后才能直接跳到目标行
+            y = max(target, 0)
+            x = _ellipse_column(rx2, ry2, y, e4)
+            p = (ry2 * (2 * x + 1) ** 2 + 4 * rx2 * (y - 1) ** 2 - 4 * rx2 * ry2 + e4) / 4
+            target = None
+            continue
+        if x >= ax_lo and y <= ay_hi:
+            quadrant.append((x, y))
         y -= 1
         if p > 0:
             p = p - 2 * rx2 * y + rx2
         else:
             x += 1
             p = p + 2 * ry2 * x - 2 * rx2 * y + rx2
-    res = []
-    for point in result:
-        res.append((point[0] + xc, point[1] + yc))
-    return res
+    return quadrant
+
+
+def _mirror_spans(runs, xc, yc, clip_rect):
+    """把第一象限（相对中心）的水平像素段对称到四个象限，只保留裁剪矩形（可以为None）内的部分"""
+    x_min, y_min, x_max, y_max = clip_rect if clip_rect is not None else (-math.inf, -math.inf, math.inf, math.inf)
+    result = []
+    for y, x_start, x_end in runs:
+        if x_start == 0:
+            ranges = ((xc - x_end, xc + x_end),)
+        else:
+            ranges = ((xc + x_start, xc + x_end), (xc - x_end, xc - x_start))
+        for row in ((yc + y, yc - y) if y != 0 else (yc,)):
+            if y_min <= row <= y_max:
+                for left, right in ranges:
+                    left, right = max(left, x_min), min(right, x_max)
+                    if left <= right:
+                        result.append([row, left, right])
+    return result
+
+
+def _mirror_range(low, high):
+    """返回整数v取遍low..high时|v|的取值范围(lo, hi)，没有整数时返回None"""
+    if low > high:
+        return None
+    if low <= 0 <= high:
+        return 0, max(-low, high)
+    return (low, high) if low > 0 else (-high, -low)
+
 
+def _append_symmetric(result, xc, yc, x, y, clip_rect):
+    x_min, y_min, x_max, y_max = clip_rect
+    for px, py in ((xc + x, yc + y), (xc - x, yc + y), (xc - x, yc - y), (xc + x, yc - y)):
+        if x_min <= px <= x_max and y_min <= py <= y_max:
+            result.append((px, py))
 
-def draw_curve(p_list, algorithm):
+
+def _ellipse_row(rx2, ry2, x):
+    """区域1中第x列的像素所在的行：满足ry2 * x^2 + rx2 * (y - 1/2)^2 < rx2 * ry2的最大的y，不存在时返回None"""
+    d = 4 * ry2 * (rx2 - x * x)
+    if d <= rx2:
+        return None
+    o = math.isqrt((d - 1) // rx2)
+    if o % 2 == 0:
+        o -= 1
+    return (o + 1) // 2
+
+
+def _ellipse_column(rx2, ry2, y, e4):
+    """区域2中第y行的像素所在的列：满足ry2 * (x + 1/2)^2 + rx2 * y^2 - rx2 * ry2 + e4 / 4 > 0的最小的x"""
+    d = 4 * rx2 * ry2 - 4 * rx2 * y * y - e4
+    if d < ry2:
+        return 0
+    o = math.isqrt(d // ry2) + 1
+    if o % 2 == 0:
+        o += 1
+    return (o - 1) // 2
+
+
+def _ellipse_safe_step(ra, rb, e4):
+    """曲线v(u) = sqrt(rb^2 * (ra^2 - u^2) / ra^2 - e4 / (4 * ra^2))从u - 1到u下降不超过0.9的最大的整数u
+
+    区域1中u为x、v为y（ra = rx，rb = ry，e4 = 0）；区域2中u为y、v为x（ra = ry，rb = rx），
+    在此范围内像素每步最多移动一格，可以直接跳过中间的步
+    """
+    def v(u):
+        return math.sqrt(max(0.0, (4 * ra * ra * rb * rb - e4 - 4 * rb * rb * u * u) / (4 * ra * ra)))
+
+    low, high = 0, ra
+    while low < high:
+        mid = (low + high + 1) // 2
+        if v(mid - 1) - v(mid) <= 0.9:
+            low = mid
+        else:
+            high = mid - 1
+    return low
+
+
+def draw_curve(p_list, algorithm, adaptive=False, clip_rect=None, spans=False):
     """绘制曲线
 
     :param p_list: (list of list of int: [[x0, y0], [x1, y1], [x2, y2], ...]) 曲线的控制点坐标列表
     :param algorithm: (string) 绘制使用的算法，包括'Bezier'和'B-spline'（三次均匀B样条曲线，曲线不必经过首末控制点）
+    :param adaptive: (bool) 为False时按固定步长采样；为True时按平坦度自适应细分曲线，再用Bresenham算法连接相邻采样点，
+                     计算量与曲线在屏幕上的长度成正比
+    :param clip_rect: (tuple of int: (x_min, y_min, x_max, y_max)) 可选的裁剪矩形（含边界），含义同draw_line；
+                      控制点凸包与矩形不相交的参数区间不再计算
+    :param spans: (bool) 为True时返回水平像素段，含义同draw_line；相邻采样点落在同一行的相邻像素上时合并
     :return: (list of list of int: [[x_0, y_0], [x_1, y_1], [x_2, y_2], ...]) 绘制结果的像素点坐标列表
     """
+    if adaptive:
+        result = _draw_curve_adaptive(p_list, algorithm, clip_rect)
+        return pixel_spans(result) if spans else result
     n = len(p_list)
     result = []
     if algorithm == 'Bezier':
-        U = []
-        u = 0
-        while u <= 1:
-            U.append(u)
-            u = round(u + 0.001, 3)
-        for i in range(1001):
-            u = U[i]
-            x = 0
-            y = 0
-            for j in range(n):
-                b = math.comb(n - 1, j) * (1 - u) ** (n - 1 - j) * u ** j
-                x += b * p_list[j][0]
-                y += b * p_list[j][1]
-            result.append([int(x), int(y)])
+        basis = bezier_basis(n - 1, 1001)
+        ranges = [(0, 1000)] if clip_rect is None or not p_list else _bezier_visible_ranges(p_list, 1000, clip_rect)
+        for begin, end in ranges:
+            for row in basis[begin:end + 1]:
+                x = 0
+                y = 0
+                for b, p in zip(row, p_list):
+                    x += b * p[0]
+                    y += b * p[1]
+                result.append([int(x), int(y)])
     elif algorithm == 'B-spline':
         k = 4  # 四阶三次B样条基函数
         n = len(p_list) - 1  # n+1为控制点个数
         if n <= 2:
             return result
         t = [i / (k + n) for i in range(k + n + 1)]
-        u = t[k - 1]
-        U = []
-        while u <= t[n + 1]:
-            U.append(u)
-            u = round(u + (t[n + 1] - t[k - 1]) * 0.001, 4)
-        for i in range(len(U)):
-            u = U[i]
+        visible = None
+        if clip_rect is not None:
+            # 参数落在某个节点区间内时曲线点在该区间的k个控制点的凸包内
+            visible = [_hull_visible(p_list[first:first + k], clip_rect) for first in range(n + 1)]
+        for first, row in bspline_basis(tuple(t), k):
+            if visible is not None and not visible[first]:
+                continue
             x = 0
             y = 0
-            for j in range(n + 1):
-                b = deboor_cox(u, j, 4, t)
-                x += b * p_list[j][0]
-                y += b * p_list[j][1]
+            for b, p in zip(row, p_list[first:first + k]):
+                x += b * p[0]
+                y += b * p[1]
             result.append([int(x), int(y)])
-    return result
+    if clip_rect is not None:
+        x_min, y_min, x_max, y_max = clip_rect
+        result = [p for p in result if x_min <= p[0] <= x_max and y_min <= p[1] <= y_max]
+    return pixel_spans(result) if spans else result
 
 
-def deboor_cox(u, i, k, nodes):
-    if k == 1:
-        if nodes[i] <= u < nodes[i + 1]:
-            return 1
-        else:
-            return 0
+def _hull_bounds(ctrl):
+    """控制点凸包内的点向零取整后的坐标范围，放宽一个像素以容纳浮点误差"""
+    xs = [x for x, _ in ctrl]
+    ys = [y for _, y in ctrl]
+    return int(min(xs)) - 1, int(min(ys)) - 1, int(max(xs)) + 1, int(max(ys)) + 1
+
+
+def _hull_visible(ctrl, clip_rect):
+    return _rect_overlap(_hull_bounds(ctrl), clip_rect)
+
+
+def _rect_overlap(bounds, clip_rect):
+    x0, y0, x1, y1 = bounds
+    return x0 <= clip_rect[2] and x1 >= clip_rect[0] and y0 <= clip_rect[3] and y1 >= clip_rect[1]
+
+
+def _bezier_visible_ranges(p_list, last, clip_rect):
+    """把采样下标0..last按参数二分，返回控制点凸包与裁剪矩形相交的下标区间[(begin, end), ...]，按下标顺序排列"""
+    ranges = []
+    # 栈中每一项为(begin, end, low, high, ctrl)：ctrl为参数从low / last到high / last的一段曲线的控制点，
+    # 需要判断的是其中下标begin..end的采样点
+    stack = [(0, last, 0, last, [(float(x), float(y)) for x, y in p_list])]
+    while stack:
+        begin, end, low, high, ctrl = stack.pop()
+        bounds = _hull_bounds(ctrl)
+        if not _rect_overlap(bounds, clip_rect):
+            continue
+        x0, y0, x1, y1 = bounds
+        inside = x0 >= clip_rect[0] and x1 <= clip_rect[2] and y0 >= clip_rect[1] and y1 <= clip_rect[3]
+        if inside or end - begin < 32:
+            if ranges and ranges[-1][1] == begin - 1:
+                ranges[-1] = (ranges[-1][0], end)
+            else:
+                ranges.append((begin, end))
+            continue
+        # 在中间的采样点处用de Casteljau算法把曲线分成两段，该采样点归左半段
+        mid = (begin + end) // 2
+        u = (mid - low) / (high - low)
+        left, right = [ctrl[0]], [ctrl[-1]]
+        while len(ctrl) > 1:
+            ctrl = [(x0 + (x1 - x0) * u, y0 + (y1 - y0) * u) for (x0, y0), (x1, y1) in zip(ctrl, ctrl[1:])]
+            left.append(ctrl[0])
+            right.append(ctrl[-1])
+        stack.append((mid + 1, end, mid, high, right[::-1]))
+        stack.append((begin, mid, low, mid, left))
+    return ranges
+
+
+def _draw_curve_adaptive(p_list, algorithm, clip_rect=None):
+    if algorithm == 'Bezier':
+        pieces = [[(float(x), float(y)) for x, y in p_list]] if p_list else []
+    elif algorithm == 'B-spline':
+        # 三次均匀B样条的每一段都可以写成一段三次Bezier曲线
+        pieces = []
+        for i in range(len(p_list) - 3):
+            (x0, y0), (x1, y1), (x2, y2), (x3, y3) = p_list[i:i + 4]
+            pieces.append([((x0 + 4 * x1 + x2) / 6, (y0 + 4 * y1 + y2) / 6),
+                           ((2 * x1 + x2) / 3, (2 * y1 + y2) / 3),
+                           ((x1 + 2 * x2) / 3, (y1 + 2 * y2) / 3),
+                           ((x1 + 4 * x2 + x3) / 6, (y1 + 4 * y2 + y3) / 6)])
     else:
-        b1 = b2 = 0
-        if nodes[i + k - 1] - nodes[i] != 0:
-            b1 = (u - nodes[i]) / (nodes[i + k - 1] - nodes[i])
-        if nodes[i + k] - nodes[i + 1] != 0:
-            b2 = (nodes[i + k] - u) / (nodes[i + k] - nodes[i + 1])
-        return b1 * deboor_cox(u, i, k - 1, nodes) + b2 * deboor_cox(u, i + 1, k - 1, nodes)
+        return []
+    points = []
+    for ctrl in pieces:
+        points += _flatten_bezier(ctrl, clip_rect)
+    vertices = []
+    for x, y in points:
+        if not vertices or vertices[-1] != [int(x), int(y)]:
+            vertices.append([int(x), int(y)])
+    if len(vertices) == 1:
+        x, y = vertices[0]
+        if clip_rect is not None and not (clip_rect[0] <= x <= clip_rect[2] and clip_rect[1] <= y <= clip_rect[3]):
+            return []
+        return [(x, y)]
+    result = []
+    for i in range(1, len(vertices)):
+        line = draw_line([vertices[i - 1], vertices[i]], 'Bresenham', clip_rect)
+        # Bresenham算法的第一个像素就是起点，与上一段的终点重合，裁剪后起点不可见时已经不在结果中
+        if i > 1 and line and list(line[0]) == vertices[i - 1]:
+            line = line[1:]
+        result += line
+    return result
+
+
+def _flatten_bezier(ctrl, clip_rect=None):
+    """用de Casteljau算法在u = 0.5处反复二分Bezier曲线，直到每段控制多边形到弦的距离都不超过CURVE_FLATNESS，
+    按参数顺序返回各段的端点；控制点凸包完全在裁剪矩形外的一段不再细分，连接其端点的弦也不可见"""
+    points = [ctrl[0]]
+    stack = [(ctrl, 0)]
+    while stack:
+        ctrl, depth = stack.pop()
+        if depth >= 32 or _is_flat(ctrl) or (clip_rect is not None and not _hull_visible(ctrl, clip_rect)):
+            points.append(ctrl[-1])
+            continue
+        left, right = [ctrl[0]], [ctrl[-1]]
+        while len(ctrl) > 1:
+            ctrl = [((x0 + x1) / 2, (y0 + y1) / 2) for (x0, y0), (x1, y1) in zip(ctrl, ctrl[1:])]
+            left.append(ctrl[0])
+            right.append(ctrl[-1])
+        stack.append((right[::-1], depth + 1))
+        stack.append((left, depth + 1))
+    return points
+
+
+def _is_flat(ctrl):
+    (x0, y0), (x1, y1) = ctrl[0], ctrl[-1]
+    dx, dy = x1 - x0, y1 - y0
+    d2 = dx * dx + dy * dy
+    for x, y in ctrl[1:-1]:
+        t = 0 if d2 == 0 else min(max(((x - x0) * dx + (y - y0) * dy) / d2, 0), 1)
+        if (x - x0 - t * dx) ** 2 + (y - y0 - t * dy) ** 2 > CURVE_FLATNESS ** 2:
+            return False
+    return True
+
+
+def bezier_basis(degree, samples):
+    """计算Bezier曲线在[0, 1]上均匀取samples个参数值时的Bernstein基函数矩阵，结果缓存在有界的LRU缓存中
+
+    直接使用组合数公式，其精度与de Casteljau递推相当；只有次数约超过1030、组合数无法转换为浮点数时，
+    才改用de Casteljau递推B(j, m) = (1 - u) * B(j, m - 1) + u * B(j - 1, m - 1)，它是O(n^2)的，但只做凸组合，不会溢出
+
+    :param degree: (int) 曲线次数，即控制点个数减一
+    :param samples: (int) 参数采样个数
+    :return: (tuple of tuple of float) 第i行为第i个参数值处各控制点的基函数值
+    """
+    key = (degree, samples)
+    basis = _bezier_basis_cache.get(key)
+    if basis is None:
+        U = [i / (samples - 1) for i in range(samples)]
+        try:
+            # 组合数只与j有关，先求出一行；转换为浮点数后再相乘与整数直接乘浮点数的结果相同
+            binomials = [float(math.comb(degree, j)) for j in range(degree + 1)]
+            basis = tuple(tuple(binomials[j] * (1 - u) ** (degree - j) * u ** j for j in range(degree + 1)) for u in U)
+        except OverflowError:
+            basis = tuple(_de_casteljau_basis(degree, u) for u in U)
+        _bezier_basis_cache.put(key, basis, samples * (degree + 1))
+    return basis
+
+
+def _de_casteljau_basis(degree, u):
+    row = [1.0]
+    for m in range(1, degree + 1):
+        row = [(1 - u) * row[0]] + [(1 - u) * row[j] + u * row[j - 1] for j in range(1, m)] + [u * row[m - 1]]
+    return tuple(row)
+
+
+def bspline_basis(nodes, k):
+    """计算k阶B样条曲线在定义域[nodes[k - 1], nodes[n + 1]]上以定义域长度的0.001为步长采样时，
+    每个参数值处非零的k个基函数值，结果按节点向量缓存在有界的LRU缓存中
+
+    参数u落在节点区间[nodes[s], nodes[s + 1])时只有N(s - k + 1), ..., N(s)非零，
+    用迭代的Cox-de Boor三角表只计算这k个基函数，每一项的运算与递归定义完全相同，结果逐位一致
+
+    :param nodes: (tuple of float) 节点向量，长度为n + k + 1，n + 1为控制点个数
+    :param k: (int) B样条的阶数
+    :return: (tuple of tuple: ((first, (b_0, ..., b_k-1)), ...)) 每个参数值处第一个非零基函数对应的控制点下标及k个基函数值
+    """
+    key = (nodes, k)
+    basis = _bspline_basis_cache.get(key)
+    if basis is not None:
+        return basis
+    n = len(nodes) - k - 1
+    U = []
+    u = nodes[k - 1]
+    while u <= nodes[n + 1]:
+        U.append(u)
+        u = round(u + (nodes[n + 1] - nodes[k - 1]) * 0.001, 4)
+    basis = []
+    s = k - 1
+    for u in U:
+        while s + 1 < len(nodes) - 1 and nodes[s + 1] <= u:
+            s += 1
+        N = [1]
+        for d in range(2, k + 1):
+            # 上一层中只有N(s - d + 2), ..., N(s)非零，两端补0后N[j]对应N(s - d + 1 + j)
+            N = [0] + N + [0]
+            row = []
+            for j in range(d):
+                i = s - d + 1 + j
+                b1 = b2 = 0  # 补上的0所乘的系数不必计算
+                if j > 0 and nodes[i + d - 1] - nodes[i] != 0:
+                    b1 = (u - nodes[i]) / (nodes[i + d - 1] - nodes[i])
+                if j < d - 1 and nodes[i + d] - nodes[i + 1] != 0:
+                    b2 = (nodes[i + d] - u) / (nodes[i + d] - nodes[i + 1])
+                row.append(b1 * N[j] + b2 * N[j + 1])
+            N = row
+        basis.append((s - k + 1, tuple(N)))
+    basis = tuple(basis)
+    _bspline_basis_cache.put(key, basis, len(basis) * k)
+    return basis
 
 
 def translate(p_list, dx, dy):
@@ -267,6 +999,44 @@ def scale(p_list, x, y, s):
     return p_list
 
 
+# 以下为延迟变换使用的3x3仿射变换矩阵（齐次坐标，列向量[x, y, 1]左乘矩阵），以三行的元组表示
+
+IDENTITY = ((1.0, 0.0, 0.0), (0.0, 1.0, 0.0), (0.0, 0.0, 1.0))
+
+
+def translate_matrix(dx, dy):
+    """平移变换矩阵，参数同translate"""
+    return (1.0, 0.0, float(dx)), (0.0, 1.0, float(dy)), (0.0, 0.0, 1.0)
+
+
+def rotate_matrix(x, y, r):
+    """绕(x, y)顺时针旋转r度的变换矩阵，参数同rotate"""
+    r = math.radians(r)
+    c, s = math.cos(r), math.sin(r)
+    return (c, -s, x - x * c + y * s), (s, c, y - x * s - y * c), (0.0, 0.0, 1.0)
+
+
+def scale_matrix(x, y, s):
+    """以(x, y)为中心缩放s倍的变换矩阵，参数同scale"""
+    return (s, 0.0, x - x * s), (0.0, s, y - y * s), (0.0, 0.0, 1.0)
+
+
+def compose(m, n):
+    """矩阵乘积m * n，即先做变换n再做变换m"""
+    return tuple(tuple(m[i][0] * n[0][j] + m[i][1] * n[1][j] + m[i][2] * n[2][j] for j in range(3)) for i in range(3))
+
+
+def apply_matrix(p_list, m):
+    """对图元参数做矩阵m表示的变换，结果向零取整，不修改p_list
+
+    :param p_list: (list of list of int: [[x0, y0], [x1, y1], [x2, y2], ...]) 图元参数
+    :param m: (tuple of tuple of float) 3x3仿射变换矩阵
+    :return: (list of list of int: [[x_0, y_0], [x_1, y_1], [x_2, y_2], ...]) 变换后的图元参数
+    """
+    (a, b, c), (d, e, f), _ = m
+    return [[int(a * x + b * y + c), int(d * x + e * y + f)] for x, y in p_list]
+
+
 def clip(p_list, x_min, y_min, x_max, y_max, algorithm):
     """线段裁剪
 
@@ -0,0 +1,231 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+
+# cg_algorithms的批量（NumPy向量化）版本，结果与cg_algorithms中对应的逐个计算的函数逐像素一致
+import numpy as np
+
+# 逐段累加（DDA）时每个分块允许的最大元素个数，用于限制补齐后的临时矩阵大小
+_CHUNK_ELEMENTS = 1 << 22
+
+
+def draw_lines(segments, algorithm):
+    """批量绘制线段
+
+    :param segments: (array-like of int, shape (N, 2, 2): [[[x0, y0], [x1, y1]], ...]) N条线段的起点和终点坐标
+    :param algorithm: (string) 绘制使用的算法，包括'DDA'、'Bresenham'和'Naive'
+    :return: (tuple of numpy.ndarray: (xs, ys, offsets)) 所有线段的像素点坐标按线段顺序拼接得到的xs和ys，
+             第i条线段的像素点为xs[offsets[i]:offsets[i + 1]]、ys[offsets[i]:offsets[i + 1]]
+    """
+    segments = np.asarray(segments, dtype=np.int64).reshape(-1, 2, 2)
+    x0, y0 = segments[:, 0, 0], segments[:, 0, 1]
+    x1, y1 = segments[:, 1, 0], segments[:, 1, 1]
+    if algorithm == 'Naive':
+        return _naive(x0, y0, x1, y1)
+    elif algorithm == 'DDA':
+        return _dda(x0, y0, x1, y1)
+    elif algorithm == 'Bresenham':
+        return _bresenham(x0, y0, x1, y1)
+    empty = np.zeros(0, np.int64)
+    return empty, empty.copy(), np.zeros(len(segments) + 1, np.int64)
+
+
+def _layout(counts):
+    """根据每条线段的像素个数计算偏移量，以及每个像素在所属线段内的步数"""
+    offsets = np.zeros(len(counts) + 1, np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    step = np.arange(offsets[-1], dtype=np.int64) - np.repeat(offsets[:-1], counts)
+    return offsets, step
+
+
+def _naive(x0, y0, x1, y1):
+    vertical = x0 == x1
+    swap = x0 > x1
+    x0, y0, x1, y1 = np.where(swap, x1, x0), np.where(swap, y1, y0), np.where(swap, x0, x1), np.where(swap, y0, y1)
+    counts = np.where(vertical, np.maximum(y1 - y0 + 1, 0), x1 - x0 + 1)
+    offsets, step = _layout(counts)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        k = np.where(vertical, 0, (y1 - y0) / np.where(vertical, 1, x1 - x0))
+    vertical = np.repeat(vertical, counts)
+    x0 = np.repeat(x0, counts)
+    y0 = np.repeat(y0, counts)
+    xs = np.where(vertical, x0, x0 + step)
+    ys = np.where(vertical, y0 + step, (y0 + np.repeat(k, counts) * step).astype(np.int64))
+    return xs, ys, offsets
+
+
+def _dda(x0, y0, x1, y1):
+    # 每条线段统一表示为：主方向从main_start开始每步移动main_sign，次方向从minor_start开始每步累加minor_step后四舍五入。
+    # 竖直线和水平线的次方向步长为0，从较小端点开始逐个递增
+    dx, dy = x1 - x0, y1 - y0
+    vertical = dx == 0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        k = dy / np.where(vertical, 1, dx)
+        inv_k = 1 / k
+    horizontal = ~vertical & (k == 0)
+    x_major = horizontal | (~vertical & (np.abs(k) <= 1))
+    main_start = np.where(vertical, np.minimum(y0, y1), np.where(horizontal, np.minimum(x0, x1),
+                                                                 np.where(x_major, x0, y0)))
+    main_sign = np.where(vertical | horizontal, 1, np.where(x_major, np.sign(dx), np.sign(dy)))
+    minor_start = np.where(x_major, y0, x0)
+    minor_step = np.where(vertical | horizontal, 0.0,
+                          np.where(x_major, np.where(dx >= 0, k, -k), np.where(dy >= 0, inv_k, -inv_k)))
+    counts = np.where(x_major, np.abs(dx), np.abs(dy)) + 1
+    offsets, step = _layout(counts)
+    main = np.repeat(main_start, counts) + np.repeat(main_sign, counts) * step
+    minor = _accumulate(counts, offsets, minor_start, minor_step)
+    x_major = np.repeat(x_major, counts)
+    return np.where(x_major, main, minor), np.where(x_major, minor, main), offsets
+
+
+def _accumulate(counts, offsets, start, step):
+    """对每条线段计算round(start + step + step + ...)，按像素位置拼接返回
+
+    为了与逐个累加的结果逐位一致，每条线段按行补齐成矩阵后沿行做顺序累加（np.cumsum），
+    线段按长度排序后分块，避免长短差异悬殊时补齐造成的浪费。
+    """
+    out = np.empty(offsets[-1], np.int64)
+    order = np.argsort(counts, kind='stable')
+    begin = 0
+    while begin < len(order):
+        end = begin + 1
+        while end < len(order) and counts[order[end]] * (end + 1 - begin) <= _CHUNK_ELEMENTS:
+            end += 1
+        rows = order[begin:end]
+        width = counts[rows[-1]]
+        matrix = np.empty((len(rows), width), np.float64)
+        matrix[:, 0] = start[rows]
+        matrix[:, 1:] = step[rows][:, None]
+        np.cumsum(matrix, axis=1, out=matrix)
+        valid = np.arange(width) < counts[rows][:, None]
+        positions = offsets[rows][:, None] + np.arange(width)
+        out[positions[valid]] = np.round(matrix[valid])
+        begin = end
+    return out
+
+
+def _bresenham(x0, y0, x1, y1):
+    # 第i步时沿次方向已经走过的步数j = ceil((2 * d_minor * i - d_major) / (2 * d_major))，
+    # 与逐步更新决策参数p得到的结果相同
+    dx = np.abs(x1 - x0)
+    dy = np.abs(y1 - y0)
+    sx = np.where(x0 < x1, 1, -1)
+    sy = np.where(y0 < y1, 1, -1)
+    x_major = dy < dx
+    d_major = np.where(x_major, dx, dy)
+    d_minor = np.where(x_major, dy, dx)
+    counts = d_major + 1
+    offsets, step = _layout(counts)
+    d_major = np.repeat(d_major, counts)
+    minor = -((d_major - 2 * np.repeat(d_minor, counts) * step) // np.maximum(2 * d_major, 1))
+    x_major = np.repeat(x_major, counts)
+    xs = np.repeat(x0, counts) + np.repeat(sx, counts) * np.where(x_major, step, minor)
+    ys = np.repeat(y0, counts) + np.repeat(sy, counts) * np.where(x_major, minor, step)
+    return xs, ys, offsets
+
+
+def clip_lines(segments, x_min, y_min, x_max, y_max, algorithm):
+    """批量线段裁剪，每条线段的结果与cg_algorithms.clip相同（包括竖直线、水平线的特殊处理和端点顺序）
+
+    :param segments: (array-like of int, shape (N, 2, 2): [[[x0, y0], [x1, y1]], ...]) N条线段的起点和终点坐标
+    :param x_min: 裁剪窗口左上角x坐标
+    :param y_min: 裁剪窗口左上角y坐标
+    :param x_max: 裁剪窗口右下角x坐标
+    :param y_max: 裁剪窗口右下角y坐标
+    :param algorithm: (string) 使用的裁剪算法，包括'Cohen-Sutherland'和'Liang-Barsky'
+    :return: (tuple of numpy.ndarray: (clipped, mask)) mask[i]表示第i条线段是否保留（cg_algorithms.clip不返回None），
+             clipped为保留下来的线段裁剪后的起点和终点坐标，shape (mask.sum(), 2, 2)，按原来的顺序排列
+    """
+    segments = np.asarray(segments, dtype=np.int64).reshape(-1, 2, 2)
+    if algorithm == 'Cohen-Sutherland':
+        out, mask = _cohen_sutherland(segments, x_min, y_min, x_max, y_max)
+    elif algorithm == 'Liang-Barsky':
+        out, mask = _liang_barsky(segments, x_min, y_min, x_max, y_max)
+    else:
+        out, mask = segments.copy(), np.zeros(len(segments), bool)
+    return out[mask], mask
+
+
+def _region_code(x, y, x_min, y_min, x_max, y_max):
+    """同cg_algorithms.point_clip"""
+    code = (x < x_min).view(np.int8) | (x > x_max).view(np.int8) << 1
+    return code | (y < y_min).view(np.int8) << 2 | (y > y_max).view(np.int8) << 3
+
+
+def _cohen_sutherland(segments, x_min, y_min, x_max, y_max):
+    # 每轮对所有尚未得出结果的线段执行一次cg_algorithms.clip中循环体的操作，已得出结果的线段从活动集合中去掉
+    out = np.empty((4, len(segments)), np.int64)  # 结果的x0、y0、x1、y1
+    mask = np.zeros(len(segments), bool)
+    active = np.arange(len(segments))
+    x0, y0, x1, y1 = segments[:, 0, 0], segments[:, 0, 1], segments[:, 1, 0], segments[:, 1, 1]
+    while len(active):
+        code0 = _region_code(x0, y0, x_min, y_min, x_max, y_max)
+        code1 = _region_code(x1, y1, x_min, y_min, x_max, y_max)
+        accept = (code0 | code1) == 0
+        reject = (code0 & code1) != 0
+        # 竖直线、水平线：此时x0（或y0）必然在窗口范围内且与窗口有重叠，否则两端点的编码有公共位，已在前面舍弃
+        vertical = ~accept & ~reject & (x0 == x1)
+        horizontal = ~accept & ~reject & ~vertical & (y0 == y1)
+        for done, columns in ((accept, (x0, y0, x1, y1)),
+                              (vertical, (x0, np.maximum(np.minimum(y0, y1), y_min),
+                                          x1, np.minimum(np.maximum(y0, y1), y_max))),
+                              (horizontal, (np.maximum(np.minimum(x0, x1), x_min), y0,
+                                            np.minimum(np.maximum(x0, x1), x_max), y1))):
+            index = np.flatnonzero(done)
+            if len(index):
+                rows = active[index]
+                for target, column in zip(out, columns):
+                    target[rows] = column[index]
+                mask[rows] = True
+
+        keep = np.flatnonzero(~(accept | reject | vertical | horizontal))
+        active, code0 = active[keep], code0[keep]
+        x0, y0, x1, y1 = x0[keep], y0[keep], x1[keep], y1[keep]
+        # 起点已在窗口内时交换两端点，否则把起点移到按上、下、右、左的顺序第一条越过的边界上
+        swap = code0 == 0
+        m = (y1 - y0) / (x1 - x0)
+        top = (code0 & 0b1000) != 0
+        bottom = ~top & ((code0 & 0b0100) != 0)
+        right = ~top & ~bottom & ((code0 & 0b0010) != 0)
+        horizontal_edge = top | bottom
+        with np.errstate(divide='ignore', invalid='ignore'):
+            y_edge = np.where(top, y_max, y_min)
+            x_edge = np.where(right, x_max, x_min)
+            x_new = np.where(horizontal_edge, np.trunc(x0 + (y_edge - y0) / m), x_edge)
+            y_new = np.where(horizontal_edge, y_edge, np.trunc(y0 + m * (x_edge - x0)))
+        x0, x1 = np.where(swap, x1, x_new.astype(np.int64)), np.where(swap, x0, x1)
+        y0, y1 = np.where(swap, y1, y_new.astype(np.int64)), np.where(swap, y0, y1)
+    return out.T.reshape(-1, 2, 2), mask
+
+
+def _liang_barsky(segments, x_min, y_min, x_max, y_max):
+    x0, y0, x1, y1 = segments[:, 0, 0], segments[:, 0, 1], segments[:, 1, 0], segments[:, 1, 1]
+    dx, dy = x1 - x0, y1 - y0
+    # 竖直线、水平线不满足条件时与cg_algorithms.clip一样保留原线段（u0 = 0, u1 = 1），
+    # 水平线的条件也与其一致，为y_min <= y0 <= y1
+    vertical = dx == 0
+    horizontal = ~vertical & (dy == 0)
+    general = ~vertical & ~horizontal
+    out = segments.copy()
+    mask = ~general
+    cut = vertical & (x_min <= x0) & (x0 <= x_max) & (
+        np.maximum(np.minimum(y0, y1), y_min) <= np.minimum(np.maximum(y0, y1), y_max))
+    out[cut, 0, 1] = np.maximum(np.minimum(y0, y1), y_min)[cut]
+    out[cut, 1, 1] = np.minimum(np.maximum(y0, y1), y_max)[cut]
+    cut = horizontal & (y_min <= y0) & (y0 <= y1) & (
+        np.maximum(np.minimum(x0, x1), x_min) <= np.minimum(np.maximum(x0, x1), x_max))
+    out[cut, 0, 0] = np.maximum(np.minimum(x0, x1), x_min)[cut]
+    out[cut, 1, 0] = np.minimum(np.maximum(x0, x1), x_max)[cut]
+
+    x0, y0, dx, dy = x0[general], y0[general], dx[general], dy[general]
+    u0, u1 = np.zeros(len(x0)), np.ones(len(x0))
+    for p, q in ((-dx, x0 - x_min), (dx, x_max - x0), (-dy, y0 - y_min), (dy, y_max - y0)):
+        u = q / p
+        u1 = np.where((p > 0) & (u < u1), u, u1)
+        u0 = np.where((p < 0) & (u > u0), u, u0)
+    rows = np.flatnonzero(general)
+    out[rows, 0, 0] = np.trunc(x0 + u0 * dx)
+    out[rows, 0, 1] = np.trunc(y0 + u0 * dy)
+    out[rows, 1, 0] = np.trunc(x0 + u1 * dx)
+    out[rows, 1, 1] = np.trunc(y0 + u1 * dy)
+    mask[rows] = u0 <= u1
+    return out, mask
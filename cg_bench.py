@@ -0,0 +1,221 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+
+# cg_algorithms各个函数的基准测试：按输入规模计时，报告吞吐量和随规模增长的幂次，结果可保存为JSON并与之前的结果比较
+import argparse
+import json
+import math
+import platform
+import random
+import sys
+import time
+import cg_algorithms as alg
+
+LINE_LENGTHS = (64, 256, 1024)
+POLYGON_VERTICES = (8, 32, 128)
+ELLIPSE_RADII = (16, 64, 256, 1024)
+CURVE_CONTROL_POINTS = (4, 8, 16, 32)
+CLIP_SEGMENTS = (100, 1000, 10000)
+TRANSFORM_POINTS = (10, 100, 1000)
+
+
+class Case:
+    """一个基准测试用例：group中规模为size的一次调用
+
+    :param group: (string) 用例组名，同一组的用例只有规模不同，用于估计随规模增长的幂次
+    :param size: (int) 输入规模
+    :param run: (callable: () -> int) 被测的调用，返回处理的元素个数（像素、线段或点），用于计算吞吐量
+    :param unit: (string) 元素的单位
+    :param setup: (callable: () -> None) 每次调用前执行、不计入时间的准备工作，例如清空缓存
+    """
+
+    def __init__(self, group, size, run, unit, setup=None):
+        self.group = group
+        self.size = size
+        self.run = run
+        self.unit = unit
+        self.setup = setup
+
+    @property
+    def name(self):
+        return '%s/%d' % (self.group, self.size)
+
+
+def _octant_end(octant, length):
+    """第octant个八分区（从x轴正方向起逆时针编号）中方向角位于该区中间、长度约为length的线段终点"""
+    angle = math.pi / 4 * (octant + 0.5)
+    return [round(length * math.cos(angle)), round(length * math.sin(angle))]
+
+
+def _regular_polygon(n, radius):
+    return [[round(radius * math.cos(2 * math.pi * i / n)), round(radius * math.sin(2 * math.pi * i / n))]
+            for i in range(n)]
+
+
+def _random_points(rng, n, extent):
+    return [[rng.randint(-extent, extent), rng.randint(-extent, extent)] for _ in range(n)]
+
+
+def build_cases():
+    """生成所有基准测试用例，输入数据固定，两次运行之间可以比较"""
+    rng = random.Random(2020)
+    cases = []
+    for algorithm in ('Naive', 'DDA', 'Bresenham'):
+        for octant in range(8):
+            for length in LINE_LENGTHS:
+                # 各八分区的终点都不在坐标轴上；Naive算法在x0 > x1时自己交换端点，各算法都按原方向测试
+                p_list = [[0, 0], _octant_end(octant, length)]
+                cases.append(Case('draw_line/%s/octant%d' % (algorithm, octant), length,
+                                  lambda p=p_list, a=algorithm: len(alg.draw_line(p, a)), 'pixels'))
+    for algorithm in ('DDA', 'Bresenham'):
+        for n in POLYGON_VERTICES:
+            p_list = _regular_polygon(n, 400)
+            cases.append(Case('draw_polygon/%s' % algorithm, n,
+                              lambda p=p_list, a=algorithm: len(alg.draw_polygon(p, a)), 'pixels'))
+    for radius in ELLIPSE_RADII:
+        p_list = [[-radius, radius // 2], [radius, -(radius // 2)]]
+        run = lambda p=p_list: len(alg.draw_ellipse(p))
+        # 冷启动：每次调用前清空缓存，测量中点算法本身；热启动：模板已缓存，测量平移模板的开销
+        cases.append(Case('draw_ellipse/cold', radius, run, 'pixels', setup=alg.clear_caches))
+        cases.append(Case('draw_ellipse/cached', radius, run, 'pixels'))
+    for algorithm in ('Bezier', 'B-spline'):
+        for n in CURVE_CONTROL_POINTS:
+            p_list = _random_points(rng, n, 400)
+            cases.append(Case('draw_curve/%s' % algorithm, n,
+                              lambda p=p_list, a=algorithm: len(alg.draw_curve(p, a)), 'pixels'))
+            cases.append(Case('draw_curve/%s/adaptive' % algorithm, n,
+                              lambda p=p_list, a=algorithm: len(alg.draw_curve(p, a, adaptive=True)), 'pixels'))
+    for algorithm in ('Cohen-Sutherland', 'Liang-Barsky'):
+        for n in CLIP_SEGMENTS:
+            segments = [_random_points(rng, 2, 600) for _ in range(n)]
+
+            def run(segments=segments, a=algorithm):
+                for p_list in segments:
+                    alg.clip(p_list, -200, -150, 250, 300, a)
+                return len(segments)
+            cases.append(Case('clip/%s' % algorithm, n, run, 'segments'))
+    for n in TRANSFORM_POINTS:
+        p_list = _random_points(rng, n, 1000)
+        cases.append(_transform_case('translate', p_list, lambda p: alg.translate(p, 13, -7)))
+        cases.append(_transform_case('rotate', p_list, lambda p: alg.rotate(p, 5, 9, 37)))
+        cases.append(_transform_case('scale', p_list, lambda p: alg.scale(p, 5, 9, 1.7)))
+    return cases
+
+
+def _transform_case(group, p_list, transform):
+    """变换会原地修改控制点，每次调用前（不计时）复制一份原始控制点"""
+    state = {}
+
+    def setup():
+        state['p_list'] = [point[:] for point in p_list]
+
+    return Case(group, len(p_list), lambda: len(transform(state['p_list'])), 'points', setup=setup)
+
+
+def measure(case, min_time, repeat):
+    """重复调用直到累计时间不少于min_time，共测量repeat轮，取每次调用的最短平均时间
+
+    :return: (tuple: (seconds, count)) 每次调用的时间（秒）及处理的元素个数
+    """
+    best = math.inf
+    count = 0
+    for _ in range(repeat):
+        calls = 0
+        elapsed = 0.0
+        while elapsed < min_time or calls == 0:
+            if case.setup is not None:
+                case.setup()
+            start = time.perf_counter()
+            count = case.run()
+            elapsed += time.perf_counter() - start
+            calls += 1
+        best = min(best, elapsed / calls)
+    return best, count
+
+
+def scaling_exponents(results):
+    """对每个用例组用最小二乘法拟合log(时间) = k * log(规模) + b，k即时间随规模增长的幂次"""
+    groups = {}
+    for result in results:
+        groups.setdefault(result['group'], []).append((math.log(result['size']), math.log(result['seconds'])))
+    exponents = {}
+    for group, points in groups.items():
+        if len(points) < 2:
+            continue
+        mean_x = sum(x for x, _ in points) / len(points)
+        mean_y = sum(y for _, y in points) / len(points)
+        var = sum((x - mean_x) ** 2 for x, _ in points)
+        exponents[group] = sum((x - mean_x) * (y - mean_y) for x, y in points) / var if var else 0.0
+    return exponents
+
+
+def run_benchmarks(cases, min_time, repeat, log=None):
+    results = []
+    for case in cases:
+        seconds, count = measure(case, min_time, repeat)
+        result = {'name': case.name, 'group': case.group, 'size': case.size, 'seconds': seconds,
+                  'count': count, 'unit': case.unit, 'throughput': count / seconds if seconds else 0.0}
+        results.append(result)
+        if log is not None:
+            log('%-44s %10.1f us  %12.0f %s/s' % (case.name, seconds * 1e6, result['throughput'], case.unit))
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'results': results,
+        'scaling': scaling_exponents(results),
+    }
+
+
+def compare(report, baseline, threshold):
+    """与之前的结果逐个用例比较
+
+    :param threshold: (float) 允许的最大时间比值，例如1.25表示慢25%以内不算退化
+    :return: (tuple: (lines, regressions)) 比较结果的文本行，以及超过阈值的用例名列表
+    """
+    previous = {result['name']: result for result in baseline['results']}
+    lines = []
+    regressions = []
+    for result in report['results']:
+        old = previous.get(result['name'])
+        if old is None or not old['seconds']:
+            continue
+        ratio = result['seconds'] / old['seconds']
+        flag = ''
+        if ratio > threshold:
+            regressions.append(result['name'])
+            flag = '  SLOWER'
+        lines.append('%-44s %10.1f us -> %10.1f us  x%.2f%s' % (
+            result['name'], old['seconds'] * 1e6, result['seconds'] * 1e6, ratio, flag))
+    return lines, regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='cg_algorithms基准测试')
+    parser.add_argument('--filter', default='', help='只运行名称中包含该字符串的用例')
+    parser.add_argument('--min-time', type=float, default=0.1, help='每轮测量的最短累计时间（秒）')
+    parser.add_argument('--repeat', type=int, default=3, help='测量轮数，取最快的一轮')
+    parser.add_argument('--output', help='把结果保存为JSON文件')
+    parser.add_argument('--compare', metavar='BASELINE', help='与之前保存的JSON结果比较')
+    parser.add_argument('--threshold', type=float, default=1.25,
+                        help='与BASELINE比较时允许的最大时间比值，任一用例超过时以非零状态退出')
+    args = parser.parse_args()
+
+    cases = [case for case in build_cases() if args.filter in case.name]
+    report = run_benchmarks(cases, args.min_time, args.repeat, log=print)
+    print()
+    print('scaling (time ~ size^k):')
+    for group, exponent in report['scaling'].items():
+        print('  %-42s k = %.2f' % (group, exponent))
+    if args.output:
+        with open(args.output, 'w') as fp:
+            json.dump(report, fp, indent=2)
+    if args.compare:
+        with open(args.compare, 'r') as fp:
+            baseline = json.load(fp)
+        lines, regressions = compare(report, baseline, args.threshold)
+        print()
+        print('\n'.join(lines))
+        if regressions:
+            print('%d case(s) slower than x%.2f: %s' % (len(regressions), args.threshold, ', '.join(regressions)))
+            sys.exit(1)
@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+
+# 命令文件的二进制编译格式：把命令文本预先解析为紧凑的二进制文件，之后每次执行时内存映射该文件，按列整块取出参数，
+# 不再切分字符串、逐个调用int()，生成的(命令名, 参数元组)与cg_interpreter.parse_commands逐条相同
+#
+# 这是可选的输入格式，只适合同一个大命令文件要反复执行的情况，收益有限：28万条命令（不保存图像）时解码比解析文本
+# 快约2.2倍，cg_cli.py从启动到结束只快约1.5倍（2.3秒对1.5秒），远没有达到预期的10倍，执行命令本身的时间不受影响。
+# 文本命令文件仍是主要的输入格式，--jobs也只支持文本文件
+#
+# 文件布局（小端序）：
+#   文件头          8字节魔数，命令条数、标量参数个数、控制点个数、字符串表字节数（各为uint64）
+#   opcodes         uint8 * 命令条数，COMMANDS中的下标
+#   value_offsets   int64 * (命令条数 + 1)，第i条命令的标量参数为values[value_offsets[i]:value_offsets[i + 1]]
+#   point_offsets   int64 * (命令条数 + 1)，第i条命令的控制点为points[point_offsets[i]:point_offsets[i + 1]]
+#   values          int64 * 标量参数个数：整数直接保存，字符串保存为字符串表下标，浮点数保存float64的二进制位
+#   points          int64 * 2 * 控制点个数，(x, y)交替存放
+#   strings         图元ID、算法名、文件名等字符串去重后用'\n'连接的UTF-8编码（命令按空白切分，字符串中不会有'\n'）
+import argparse
+import gc
+import mmap
+import os
+import struct
+from array import array
+from itertools import repeat
+import numpy as np
+import cg_interpreter
+
+MAGIC = b'CGBIN001'
+HEADER = struct.Struct('<8s4Q')
+BLOCK_SIZE = 8192  # 每次解码这么多条命令，内存占用与命令条数无关
+
+# 命令名及其参数的类型：i为整数，f为浮点数，s为字符串，p为控制点列表（每条命令至多一个）
+COMMANDS = (
+    ('resetCanvas', 'ii'),
+    ('saveCanvas', 's'),
+    ('setColor', 'iii'),
+    ('drawLine', 'sps'),
+    ('drawPolygon', 'sps'),
+    ('drawEllipse', 'sp'),
+    ('drawCurve', 'sps'),
+    ('fillPolygon', 'sps'),
+    ('clip', 'siiiis'),
+    ('translate', 'sii'),
+    ('rotate', 'siii'),
+    ('scale', 'siif'),
+)
+OPCODES = {name: code for code, (name, _) in enumerate(COMMANDS)}
+
+
+def compile_commands(stream, path):
+    """把命令文本编译为二进制文件
+
+    :param stream: (iterable of str) 命令文本的行，例如打开的文件
+    :param path: (string) 输出的二进制文件路径
+    :return: (int) 命令条数
+    """
+    opcodes = array('B')
+    value_offsets = array('q', [0])
+    point_offsets = array('q', [0])
+    values = array('q')
+    points = array('q')
+    strings = {}
+    for name, args in cg_interpreter.parse_commands(stream):
+        code = OPCODES[name]
+        for kind, arg in zip(COMMANDS[code][1], args):
+            if kind == 'i':
+                values.append(arg)
+            elif kind == 's':
+                values.append(strings.setdefault(arg, len(strings)))
+            elif kind == 'f':
+                values.append(struct.unpack('<q', struct.pack('<d', arg))[0])
+            else:
+                for x, y in arg:
+                    points.append(x)
+                    points.append(y)
+        opcodes.append(code)
+        value_offsets.append(len(values))
+        point_offsets.append(len(points) // 2)
+    string_data = '\n'.join(strings).encode()
+    with open(path, 'wb') as fp:
+        fp.write(HEADER.pack(MAGIC, len(opcodes), len(values), len(points) // 2, len(string_data)))
+        for column in (opcodes, value_offsets, point_offsets, values, points):
+            column.tofile(fp)
+        fp.write(string_data)
+    return len(opcodes)
+
+
+def is_compiled(path):
+    """文件是否为compile_commands生成的二进制文件"""
+    with open(path, 'rb') as fp:
+        return fp.read(len(MAGIC)) == MAGIC
+
+
+def load_commands(path):
+    """内存映射二进制文件并逐条生成命令，同cg_interpreter.parse_commands
+
+    每块命令按命令类型分组，同一类命令的每个参数用一次NumPy取值和tolist得到一整列，再用zip拼成参数元组，
+    逐条命令执行的Python代码只剩按原顺序取出元组
+
+    :param path: (string) compile_commands生成的二进制文件
+    :return: (generator of tuple: (name, args)) 命令名及参数
+    """
+    with open(path, 'rb') as fp:
+        mm = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, count, n_values, n_points, n_bytes = HEADER.unpack_from(mm)
+    if magic != MAGIC:
+        raise ValueError('%s is not a compiled command file' % path)
+    position = HEADER.size
+    opcodes = np.frombuffer(mm, np.uint8, count, position)
+    position += count
+    value_offsets = np.frombuffer(mm, np.int64, count + 1, position)
+    position += 8 * (count + 1)
+    point_offsets = np.frombuffer(mm, np.int64, count + 1, position)
+    position += 8 * (count + 1)
+    values = np.frombuffer(mm, np.int64, n_values, position)
+    position += 8 * n_values
+    points = np.frombuffer(mm, np.int64, 2 * n_points, position).reshape(-1, 2)
+    position += 16 * n_points
+    strings = mm[position:position + n_bytes].decode().split('\n')
+    for start in range(0, count, BLOCK_SIZE):
+        stop = min(start + BLOCK_SIZE, count)
+        codes = opcodes[start:stop]
+        order = np.argsort(codes, kind='stable')
+        groups = np.flatnonzero(np.diff(codes[order])) + 1
+        decoded = []
+        # 解码时一次创建大量不含循环引用的列表，期间暂停循环垃圾回收，否则会反复扫描这些刚创建的对象；yield之前恢复
+        enabled = gc.isenabled()
+        gc.disable()
+        try:
+            for indices in np.split(order + start, groups):
+                name, signature = COMMANDS[opcodes[indices[0]]]
+                decoded.extend(zip(repeat(name), _decode_group(
+                    signature, value_offsets[indices], point_offsets[indices], point_offsets[indices + 1],
+                    values, points, strings)))
+        finally:
+            if enabled:
+                gc.enable()
+        inverse = np.empty_like(order)
+        inverse[order] = np.arange(len(order))
+        yield from map(decoded.__getitem__, inverse.tolist())
+
+
+def _decode_group(signature, value_starts, point_starts, point_ends, values, points, strings):
+    """解码一组同类命令，返回参数元组的迭代器"""
+    columns = []
+    j = 0
+    for kind in signature:
+        if kind == 'p':
+            # 只取出这组命令的控制点，拼接后按各命令的点数切分
+            counts = point_ends - point_starts
+            ends = np.cumsum(counts)
+            starts = ends - counts
+            block = points[np.arange(int(ends[-1])) - np.repeat(starts - point_starts, counts)].tolist()
+            columns.append(map(block.__getitem__, map(slice, starts.tolist(), ends.tolist())))
+            continue
+        column = values[value_starts + j]
+        j += 1
+        if kind == 'i':
+            columns.append(column.tolist())
+        elif kind == 's':
+            columns.append(map(strings.__getitem__, column.tolist()))
+        else:
+            columns.append(column.view(np.float64).tolist())
+    return zip(*columns)
+
+
+def run(path, output_dir, **options):
+    """执行二进制命令文件，同cg_interpreter.run"""
+    os.makedirs(output_dir, exist_ok=True)
+    interpreter = cg_interpreter.Interpreter(output_dir, **options)
+    try:
+        interpreter.execute(load_commands(path))
+    finally:
+        interpreter.close()
+    return interpreter
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='把命令文件编译为二进制格式，cg_cli可以直接执行编译后的文件')
+    parser.add_argument('input_file')
+    parser.add_argument('output_file')
+    args = parser.parse_args()
+    with open(args.input_file, 'r') as fp:
+        print('%d commands compiled' % compile_commands(fp, args.output_file))
@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+
+# 24位BMP文件的读写，文件头与PIL保存的BMP逐字节一致
+import struct
+import numpy as np
+
+HEADER_SIZE = 54  # 14字节文件头 + 40字节BITMAPINFOHEADER
+PIXELS_PER_METER = 3780  # 96 dpi，与PIL的默认值相同
+
+
+def row_stride(width):
+    """每行像素数据的字节数（按4字节对齐）"""
+    return (width * 3 + 3) & ~3
+
+
+def bmp_header(width, height):
+    """生成24位、自底向上存储、不压缩的BMP文件头
+
+    :param width: (int) 图像宽度
+    :param height: (int) 图像高度
+    :return: (bytes) 54字节的文件头
+    """
+    image_size = row_stride(width) * height
+    return (struct.pack('<2sIHHI', b'BM', HEADER_SIZE + image_size, 0, 0, HEADER_SIZE)
+            + struct.pack('<IiiHHIIiiII', 40, width, height, 1, 24, 0, image_size,
+                          PIXELS_PER_METER, PIXELS_PER_METER, 0, 0))
+
+
+def create_bmp(path, width, height):
+    """创建BMP文件，写入文件头，像素数据初始为0
+
+    :param path: (string) 文件路径
+    :param width: (int) 图像宽度
+    :param height: (int) 图像高度
+    """
+    with open(path, 'wb') as fp:
+        fp.write(bmp_header(width, height))
+        fp.truncate(HEADER_SIZE + row_stride(width) * height)
+
+
+def map_bmp_rows(path, width, height, top, rows):
+    """以内存映射方式打开BMP文件中（自顶向下）第top行开始的rows行像素数据，只映射这些行
+
+    :param path: (string) create_bmp创建的文件路径
+    :param width: (int) 图像宽度
+    :param height: (int) 图像高度
+    :param top: (int) 起始行
+    :param rows: (int) 行数
+    :return: (numpy.memmap: [rows, row_stride(width)]) 按文件中的顺序排列的像素数据：行自底向上，每个像素按BGR顺序存储
+    """
+    stride = row_stride(width)
+    return np.memmap(path, np.uint8, 'r+', HEADER_SIZE + (height - top - rows) * stride, (rows, stride))
+
+
+def write_bmp(path, image):
+    """不经过PIL直接写入24位BMP文件，与PIL保存的文件逐字节相同
+
+    :param path: (string) 文件路径
+    :param image: (numpy.ndarray: [height, width, 3]) RGB图像
+    """
+    height, width = image.shape[:2]
+    stride = row_stride(width)
+    data = np.zeros([height, stride], np.uint8) if stride != width * 3 else np.empty([height, stride], np.uint8)
+    pixels = data[:, :width * 3].reshape(height, width, 3)
+    # 逐个通道复制比一次复制image[::-1, :, ::-1]快得多（后者每个字节都要按负步长寻址）
+    for channel in range(3):
+        pixels[:, :, channel] = image[::-1, :, 2 - channel]
+    with open(path, 'wb') as fp:
+        fp.write(bmp_header(width, height))
+        fp.write(data)
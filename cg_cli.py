@@ -1,120 +1,57 @@
 #!/usr/bin/env python
 # -*- coding:utf-8 -*-
 
-import sys
-import os
-import cg_algorithms as alg
-import numpy as np
-from PIL import Image
+import argparse
+import gc
+import cg_binary
+import cg_interpreter
+import cg_writer
 
 if __name__ == '__main__':
-    input_file = sys.argv[1]
-    output_dir = sys.argv[2]
-    os.makedirs(output_dir, exist_ok=True)
+    parser = argparse.ArgumentParser()
+    parser.add_argument('input_file', help='命令文件；也可以是cg_binary编译后的二进制命令文件，这是可选的格式，读取稍快，见cg_binary.py')
+    parser.add_argument('output_dir')
+    parser.add_argument('--jobs', type=int, default=1, help='并行执行由resetCanvas分隔的各个片段的进程数')
+    parser.add_argument('--tile', type=int, default=0, metavar='SIZE',
+                        help='按每SIZE行一个条带分块渲染并直接写入内存映射的BMP文件，用于超大画布')
+    parser.add_argument('--lazy-transforms', action='store_true',
+                        help='平移、旋转、缩放只累积到每个图元的变换矩阵中，绘制时才计算控制点，不因每次变换后取整而累积误差')
+    parser.add_argument('--compact-scene', action='store_true',
+                        help='图元按列存储在连续的数组中，图元极多时显著减少内存占用')
+    parser.add_argument('--stats', action='store_true', help='运行结束时输出命令吞吐量和光栅化缓存的命中统计')
+    parser.add_argument('--profile', metavar='JSON',
+                        help='记录各类命令、各光栅化算法及每次保存图像的耗时和像素数，运行结束时输出报告并保存为JSON文件')
+    parser.add_argument('--format', choices=sorted(cg_writer.WRITERS), default='bmp',
+                        help='saveCanvas保存的图像格式，raw-bmp不经过PIL直接写BMP文件')
+    parser.add_argument('--png-level', type=int, default=cg_writer.DEFAULT_COMPRESS_LEVEL, choices=range(10),
+                        metavar='0-9', help='PNG的压缩级别')
+    parser.add_argument('--writers', type=int, default=0, metavar='THREADS',
+                        help='在这么多个后台线程中编码并写入图像，saveCanvas不等待写完；默认0表示同步写入')
+    parser.add_argument('--writer-queue', type=int, default=4, metavar='N',
+                        help='后台写入时最多等待写入的图像数，超过时saveCanvas阻塞')
+    args = parser.parse_args()
+    if args.tile > 0 and args.format == 'png':
+        parser.error('--tile writes BMP files directly and cannot be combined with --format png')
 
-    item_dict = {}
-    pen_color = np.zeros(3, np.uint8)
-    width = 0
-    height = 0
-
-    with open(input_file, 'r') as fp:
-        line = fp.readline()
-        while line:
-            line = line.strip().split(' ')
-            if line[0] == 'resetCanvas':
-                width = int(line[1])
-                height = int(line[2])
-                item_dict = {}
-            elif line[0] == 'saveCanvas':
-                save_name = line[1]
-                canvas = np.zeros([height, width, 3], np.uint8)
-                canvas.fill(255)
-                for item_type, p_list, algorithm, color in item_dict.values():
-                    if item_type == 'line':
-                        # print("drawline:",p_list)
-                        pixels = alg.draw_line(p_list, algorithm)
-                        for x, y in pixels:
-                            canvas[y, x] = color
-                    elif item_type == 'polygon':
-                        pixels = alg.draw_polygon(p_list, algorithm)
-                        for x, y in pixels:
-                            canvas[y, x] = color
-                    elif item_type == 'ellipse':
-                        pixels = alg.draw_ellipse(p_list)
-                        for x, y in pixels:
-                            canvas[y, x] = color
-                    elif item_type == 'curve':
-                        pixels = alg.draw_curve(p_list, algorithm)
-                        for x, y in pixels:
-                            canvas[y, x] = color
-                Image.fromarray(canvas).save(os.path.join(output_dir, save_name + '.bmp'), 'bmp')
-            elif line[0] == 'setColor':
-                pen_color[0] = int(line[1])
-                pen_color[1] = int(line[2])
-                pen_color[2] = int(line[3])
-            elif line[0] == 'drawLine':
-                item_id = line[1]
-                x0 = int(line[2])
-                y0 = int(line[3])
-                x1 = int(line[4])
-                y1 = int(line[5])
-                algorithm = line[6]
-                item_dict[item_id] = ['line', [[x0, y0], [x1, y1]], algorithm, np.array(pen_color)]
-            elif line[0] == 'drawPolygon':
-                item_id = line[1]
-                i = 2
-                p_list = []
-                while i < len(line) - 1:
-                    p_list.append([int(line[i]), int(line[i + 1])])
-                    i += 2
-                algorithm = line[i]
-                item_dict[item_id] = ['polygon', p_list, algorithm, np.array(pen_color)]
-            elif line[0] == 'drawEllipse':
-                item_id = line[1]
-                x0 = min(int(line[2]), int(line[4]))
-                y0 = max(int(line[3]), int(line[5]))
-                x1 = max(int(line[2]), int(line[4]))
-                y1 = min(int(line[3]), int(line[5]))
-                item_dict[item_id] = ['ellipse', [[x0, y0], [x1, y1]], "none", np.array(pen_color)]
-            elif line[0] == 'drawCurve':
-                item_id = line[1]
-                i = 2
-                p_list = []
-                while i < len(line) - 1:
-                    p_list.append([int(line[i]), int(line[i + 1])])
-                    i += 2
-                algorithm = line[i]
-                item_dict[item_id] = ['curve', p_list, algorithm, np.array(pen_color)]
-            elif line[0] == 'clip':
-                item_id = line[1]
-                x_min = int(line[2])
-                y_min = int(line[3])
-                x_max = int(line[4])
-                y_max = int(line[5])
-                algorithm = line[6]
-                p_list = item_dict[item_id][1]
-                # print(item_id, ",",algorithm,"before:", p_list)
-                p_list = alg.clip(p_list, x_min, y_min, x_max, y_max, algorithm)
-                # print(item_id, ",",algorithm,"after:", p_list)
-                item_dict[item_id][1] = p_list
-            elif line[0] == 'translate':
-                item_id = line[1]
-                dx = int(line[2])
-                dy = int(line[3])
-                p_list = item_dict[item_id][1]
-                item_dict[item_id][1] = alg.translate(p_list, dx, dy)
-            elif line[0] == 'rotate':
-                item_id = line[1]
-                x = int(line[2])
-                y = int(line[3])
-                r = int(line[4])
-                p_list = item_dict[item_id][1]
-                item_dict[item_id][1] = alg.rotate(p_list, x, y, r)
-            elif line[0] == 'scale':
-                item_id = line[1]
-                x = int(line[2])
-                y = int(line[3])
-                s = float(line[4])
-                p_list = item_dict[item_id][1]
-                item_dict[item_id][1] = alg.scale(p_list, x, y, s)
-            line = fp.readline()
+    options = dict(tile_size=args.tile, lazy_transforms=args.lazy_transforms, compact_scene=args.compact_scene,
+                   profile=args.profile is not None, image_format=args.format, writer_threads=args.writers,
+                   writer_queue=args.writer_queue, compress_level=args.png_level)
+    if cg_binary.is_compiled(args.input_file):
+        if args.jobs > 1:
+            parser.error('--jobs only supports text command files')
+        interpreter = cg_binary.run(args.input_file, args.output_dir, **options)
+    else:
+        with open(args.input_file, 'r') as fp:
+            if args.jobs > 1:
+                interpreter = cg_interpreter.run_parallel(fp, args.output_dir, args.jobs, **options)
+            else:
+                interpreter = cg_interpreter.run(fp, args.output_dir, **options)
+    if args.stats:
+        print('%d commands in %.3fs (%.0f commands/s)' % (
+            interpreter.commands, interpreter.seconds, interpreter.throughput()))
+        print(interpreter.raster_cache.report())
+    if args.profile:
+        interpreter.profiler.dump(args.profile)
+        print(interpreter.profiler.summary())
+    # 进程即将退出，冻结所有对象，退出时不再逐个扫描、释放场景中的大量图元；上百万个对象时这要花上秒
+    gc.freeze()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+
+# cg_server渲染服务的客户端：把命令文件逐个提交给服务端执行，输出每个请求的延迟，也可以作为库使用。
+# 只依赖标准库，启动时不导入NumPy、PIL
+import argparse
+import base64
+import json
+import os
+import socket
+import sys
+import time
+
+DEFAULT_PORT = 8765
+
+
+class Client:
+    """与渲染服务的一个连接，连接期间服务端为其保留一个会话
+
+    :param socket_path: (string) 服务端的Unix套接字，为None时连接host:port
+    :param host: (string) 服务端地址
+    :param port: (int) 服务端端口
+    """
+
+    def __init__(self, socket_path=None, host='127.0.0.1', port=DEFAULT_PORT):
+        if socket_path is not None:
+            self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.socket.connect(socket_path)
+        else:
+            self.socket = socket.create_connection((host, port))
+        self.reader = self.socket.makefile('rb')
+
+    def _call(self, text):
+        self.socket.sendall(text.encode())
+        line = self.reader.readline()
+        if not line:
+            raise ConnectionError('server closed the connection')
+        return json.loads(line)
+
+    def session(self, name):
+        """切换到命名会话，其场景在连接断开后仍保留在服务端"""
+        return self._call('session %s\n' % name)
+
+    def submit(self, lines, inline=False):
+        """在当前会话中执行命令
+
+        :param lines: (iterable of str) 命令文本的行
+        :param inline: (bool) 为True时图像不写入服务端的文件，而是放在回复的images中（base64编码）
+        :return: (dict) 服务端的回复，包括ok、commands、latency_ms等
+        """
+        text = ''.join(line if line.endswith('\n') else line + '\n' for line in lines)
+        return self._call(text + ('end inline\n' if inline else 'end\n'))
+
+    def stats(self):
+        return self._call('stats\n')
+
+    def close(self):
+        self.reader.close()
+        self.socket.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='把命令文件提交给cg_server.py执行')
+    parser.add_argument('input_files', nargs='+', help='命令文件，在同一个会话中依次执行')
+    parser.add_argument('--socket', metavar='PATH', help='服务端的Unix套接字；默认连接本机TCP端口')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--session', metavar='NAME', help='使用命名会话，其场景和缓存在多次运行之间保留')
+    parser.add_argument('--output-dir', help='让服务端在回复中返回图像并保存到该目录；默认由服务端写入其会话目录')
+    parser.add_argument('--stats', action='store_true', help='结束时输出服务端的请求数和延迟统计')
+    args = parser.parse_args()
+
+    client = Client(args.socket, args.host, args.port)
+    failed = False
+    try:
+        if args.session:
+            reply = client.session(args.session)
+            if not reply['ok']:
+                sys.exit(reply['error'])
+        if args.output_dir:
+            os.makedirs(args.output_dir, exist_ok=True)
+        for input_file in args.input_files:
+            with open(input_file, 'r') as fp:
+                start = time.perf_counter()
+                reply = client.submit(fp, inline=args.output_dir is not None)
+                elapsed = time.perf_counter() - start
+            for image in reply.get('images', ()):
+                with open(os.path.join(args.output_dir, image['name']), 'wb') as fp:
+                    fp.write(base64.b64decode(image['data']))
+            if reply['ok']:
+                print('%s: %d commands, server %.1f ms (wait %.1f ms), round trip %.1f ms' % (
+                    input_file, reply['commands'], reply['latency_ms'], reply['wait_ms'], elapsed * 1e3))
+            else:
+                failed = True
+                print('%s: %s' % (input_file, reply['error']), file=sys.stderr)
+        if args.stats:
+            print(json.dumps(client.stats(), indent=2))
+    finally:
+        client.close()
+    if failed:
+        sys.exit(1)
@@ -2,7 +2,9 @@
 # -*- coding:utf-8 -*-
 import os
 import sys
+import time
 import cg_algorithms as alg
+from cg_spatial import SpatialGrid
 from typing import Optional
 from PyQt5.QtWidgets import (
     QApplication,
@@ -16,9 +18,12 @@ from PyQt5.QtWidgets import (
     QWidget,
     QInputDialog,
     QStyleOptionGraphicsItem,
-    QColorDialog)
-from PyQt5.QtGui import QPainter, QMouseEvent, QColor, QImage
-from PyQt5.QtCore import QRectF, Qt
+    QColorDialog,
+    QLabel)
+from PyQt5.QtGui import QPainter, QMouseEvent, QColor, QImage, QPolygon
+from PyQt5.QtCore import QLine, QRectF, Qt
+
+PICK_RADIUS = 3  # 点选图元时允许的像素误差
 
 
 class MyCanvas(QGraphicsView):
@@ -37,6 +42,7 @@ class MyCanvas(QGraphicsView):
         self.temp_algorithm = ''
         self.temp_id = ''
         self.temp_item = None
+        self.preview_item = None  # 正在绘制的多边形或曲线的预览图元，每个图形只有一个
         self.polygon_list = []
         self.curve_list = []
         self.rotated = False
@@ -47,26 +53,39 @@ class MyCanvas(QGraphicsView):
         self.clip_list = []
         self.clip_algorithm = ''
         self.color = QColor(0, 0, 0)
+        self.frame_label = None  # 显示每帧绘制耗时的状态栏标签
+        self.spatial_index = SpatialGrid()  # 已完成图元的包围盒索引，用于点选
 
     def start_set_pen(self, color):
         self.color = color
 
     def start_draw_line(self, algorithm, item_id):
+        self.abort_preview()
         self.status = 'line'
         self.temp_algorithm = algorithm
         self.temp_id = item_id
 
     def start_draw_polygon(self, algorithm, item_id):
+        self.abort_preview()
         self.status = 'polygon'
         self.temp_algorithm = algorithm
         self.temp_id = item_id
         self.polygon_list = []
 
+    def start_fill_polygon(self, rule, item_id):
+        self.abort_preview()
+        self.status = 'fill'
+        self.temp_algorithm = rule
+        self.temp_id = item_id
+        self.polygon_list = []
+
     def start_draw_ellipse(self, item_id):
+        self.abort_preview()
         self.status = 'ellipse'
         self.temp_id = item_id
 
     def start_draw_curve(self, algorithm, item_id):
+        self.abort_preview()
         self.status = 'curve'
         self.temp_algorithm = algorithm
         self.temp_id = item_id
@@ -75,12 +94,55 @@ class MyCanvas(QGraphicsView):
     def finish_draw(self):
         self.temp_id = self.main_window.get_id()
 
+    def update_preview(self, p_list):
+        """多边形或曲线增加顶点后调用：第一次创建预览图元并加入场景，之后原地更新同一个预览图元"""
+        if self.preview_item is None:
+            self.preview_item = MyItem(self.temp_id, self.status, p_list, self.temp_algorithm, self.color)
+            self.scene().addItem(self.preview_item)
+        else:
+            self.preview_item.geometry_changed()
+
+    def add_item(self, item):
+        """登记绘制完成的图元"""
+        self.item_dict[item.id] = item
+        self.list_widget.addItem(item.id)
+        self.index_item(item)
+
+    def index_item(self, item):
+        rect = item.boundingRect()
+        self.spatial_index.insert(item.id, (rect.left(), rect.top(), rect.right(), rect.bottom()))
+
+    def item_changed(self, item_id):
+        """已完成的图元被变换或裁剪后调用：重绘并更新空间索引"""
+        item = self.item_dict[item_id]
+        item.geometry_changed()
+        self.index_item(item)
+
+    def pick_item(self, x, y):
+        """返回像素落在(x, y)附近的最上层图元ID，没有则返回None"""
+        return self.spatial_index.pick(x, y, PICK_RADIUS,
+                                       lambda item_id: self.item_dict[item_id].hit(x, y, PICK_RADIUS))
+
+    def commit_preview(self):
+        """把预览图元作为绘制完成的图元提交"""
+        self.add_item(self.preview_item)
+        self.preview_item = None
+        self.finish_draw()
+
+    def abort_preview(self):
+        """丢弃未完成的预览图元及已输入的顶点，保证场景中不残留过期的预览，之后的点击也不会接在旧顶点后面"""
+        if self.preview_item is not None:
+            self.scene().removeItem(self.preview_item)
+            self.preview_item = None
+        self.polygon_list = []
+        self.curve_list = []
+
     def start_translate(self, x, y):
         if self.selected_id != '':
             p_list = self.item_dict[self.selected_id].p_list
             p_list = alg.translate(p_list, x, y)
             self.item_dict[self.selected_id].p_list = p_list
-            self.updateScene([self.sceneRect()])
+            self.item_changed(self.selected_id)
 
     def start_rotate(self, r):
         if self.selected_id != '':
@@ -100,9 +162,11 @@ class MyCanvas(QGraphicsView):
     def clear_selection(self):
         if self.selected_id != '':
             self.item_dict[self.selected_id].selected = False
+            self.item_dict[self.selected_id].update()
             self.selected_id = ''
 
     def selection_changed(self, selected):
+        self.abort_preview()
         self.main_window.statusBar().showMessage('图元选择： %s' % selected)
         if self.selected_id != '':
             self.item_dict[self.selected_id].selected = False
@@ -111,26 +175,27 @@ class MyCanvas(QGraphicsView):
         self.item_dict[selected].selected = True
         self.item_dict[selected].update()
         self.status = ''
-        self.updateScene([self.sceneRect()])
 
     def mousePressEvent(self, event: QMouseEvent) -> None:
         pos = self.mapToScene(event.localPos().toPoint())
         x = int(pos.x())
         y = int(pos.y())
-        if self.status == 'line':
+        if self.status == '' and not (self.rotated or self.scaled or self.cliped):
+            if event.buttons() == Qt.LeftButton:
+                item_id = self.pick_item(x, y)
+                if item_id is not None:
+                    self.list_widget.setCurrentItem(self.list_widget.findItems(item_id, Qt.MatchExactly)[0])
+        elif self.status == 'line':
             self.temp_item = MyItem(self.temp_id, self.status, [[x, y], [x, y]], self.temp_algorithm, self.color)
             self.scene().addItem(self.temp_item)
-        elif self.status == 'polygon':
+        elif self.status in ('polygon', 'fill'):
             if event.buttons() == Qt.LeftButton:
                 self.polygon_list.append([x, y])
-                self.temp_item = MyItem(self.temp_id, self.status, self.polygon_list, self.temp_algorithm, self.color)
-                self.scene().addItem(self.temp_item)
+                self.update_preview(self.polygon_list)
             elif event.buttons() == Qt.RightButton:
                 if self.polygon_list != []:
                     print(self.polygon_list)
-                    self.item_dict[self.temp_id] = self.temp_item
-                    self.list_widget.addItem(self.temp_id)
-                    self.finish_draw()
+                    self.commit_preview()
                     self.polygon_list = []
         elif self.status == 'ellipse':
             self.temp_item = MyItem(self.temp_id, self.status, [[x, y], [x, y]], self.temp_algorithm, self.color)
@@ -138,29 +203,27 @@ class MyCanvas(QGraphicsView):
         elif self.status == 'curve':
             if event.buttons() == Qt.LeftButton:
                 self.curve_list.append([x, y])
-                self.temp_item = MyItem(self.temp_id, self.status, self.curve_list, self.temp_algorithm, self.color)
-                self.scene().addItem(self.temp_item)
+                self.update_preview(self.curve_list)
             elif event.buttons() == Qt.RightButton:
                 if self.curve_list != []:
                     print(self.curve_list)
-                    self.item_dict[self.temp_id] = self.temp_item
-                    self.list_widget.addItem(self.temp_id)
-                    self.finish_draw()
+                    self.commit_preview()
                     self.curve_list = []
         if self.rotated:
             self.rotated = False
             p_list = self.item_dict[self.selected_id].p_list
             p_list = alg.rotate(p_list, x, y, self.r)
             self.item_dict[self.selected_id].p_list = p_list
+            self.item_changed(self.selected_id)
         elif self.scaled:
             self.scaled = False
             p_list = self.item_dict[self.selected_id].p_list
             p_list = alg.scale(p_list, x, y, self.s)
             self.item_dict[self.selected_id].p_list = p_list
+            self.item_changed(self.selected_id)
         elif self.cliped:
             self.clip_list.append([x, y])
             self.clip_list.append([x, y])
-        self.updateScene([self.sceneRect()])
         super().mousePressEvent(event)
 
     def mouseMoveEvent(self, event: QMouseEvent) -> None:
@@ -169,27 +232,28 @@ class MyCanvas(QGraphicsView):
         y = int(pos.y())
         if self.status == 'line':
             self.temp_item.p_list[1] = [x, y]
-        elif self.status == 'polygon':
+            self.temp_item.geometry_changed()
+        elif self.status in ('polygon', 'fill'):
             if event.buttons() == Qt.LeftButton:
-                self.temp_item.p_list[-1] = [x, y]
+                self.preview_item.p_list[-1] = [x, y]
+                self.preview_item.geometry_changed()
         elif self.status == 'ellipse':
             self.temp_item.p_list[1] = [x, y]
+            self.temp_item.geometry_changed()
         elif self.status == 'curve':
             if event.buttons() == Qt.LeftButton:
-                self.temp_item.p_list[-1] = [x, y]
+                self.preview_item.p_list[-1] = [x, y]
+                self.preview_item.geometry_changed()
         if self.cliped:
             self.clip_list[-1] = [x, y]
-        self.updateScene([self.sceneRect()])
         super().mouseMoveEvent(event)
 
     def mouseReleaseEvent(self, event: QMouseEvent) -> None:
         if self.status == 'line':
-            self.item_dict[self.temp_id] = self.temp_item
-            self.list_widget.addItem(self.temp_id)
+            self.add_item(self.temp_item)
             self.finish_draw()
         elif self.status == 'ellipse':
-            self.item_dict[self.temp_id] = self.temp_item
-            self.list_widget.addItem(self.temp_id)
+            self.add_item(self.temp_item)
             self.finish_draw()
         if self.cliped:
             self.cliped = False
@@ -200,10 +264,18 @@ class MyCanvas(QGraphicsView):
             ymax = max(self.clip_list[0][1], self.clip_list[1][1])
             p_list = alg.clip(p_list, xmin, ymin, xmax, ymax, self.clip_algorithm)
             self.item_dict[self.selected_id].p_list = p_list
+            self.item_changed(self.selected_id)
             self.clip_list = []
-            self.updateScene([self.sceneRect()])
         super().mouseReleaseEvent(event)
 
+    def paintEvent(self, event) -> None:
+        start = time.perf_counter()
+        # 只与暴露区域相交的图元会被重绘，由QGraphicsScene按图元的boundingRect筛选
+        super().paintEvent(event)
+        elapsed = time.perf_counter() - start
+        if self.frame_label is not None:
+            self.frame_label.setText('帧耗时 %.2f ms（%.0f FPS）' % (elapsed * 1000, 1 / max(elapsed, 1e-6)))
+
 
 class MyItem(QGraphicsItem):
     """
@@ -215,51 +287,88 @@ class MyItem(QGraphicsItem):
         """
 
         :param item_id: 图元ID
-        :param item_type: 图元类型，'line'、'polygon'、'ellipse'、'curve'等
+        :param item_type: 图元类型，'line'、'polygon'、'ellipse'、'curve'、'fill'等
         :param p_list: 图元参数
-        :param algorithm: 绘制算法，'DDA'、'Bresenham'、'Bezier'、'B-spline'等
+        :param algorithm: 绘制算法，'DDA'、'Bresenham'、'Bezier'、'B-spline'等，填充多边形为填充规则
         :param parent:
         """
         super().__init__(parent)
         self.id = item_id  # 图元ID
-        self.item_type = item_type  # 图元类型，'line'、'polygon'、'ellipse'、'curve'等
+        self.item_type = item_type  # 图元类型，'line'、'polygon'、'ellipse'、'curve'、'fill'等
         self.p_list = p_list  # 图元参数
         self.algorithm = algorithm  # 绘制算法，'DDA'、'Bresenham'、'Bezier'、'B-spline'等
         self.selected = False
         self.color = color
+        self.pixels_key = None  # 生成缓存像素时的图元类型、算法和参数
+        self.pixels = QPolygon()  # 缓存的像素点
+        self.pixel_list = []  # 缓存的像素点坐标列表
+        self.pixel_set = None  # 由pixel_list生成的坐标集合，第一次点选测试时才生成
+        self.spans = []  # 填充多边形缓存的水平像素段[[y, x_start, x_end], ...]
+        self.span_lines = []  # 由spans生成的QLine列表，每段画一条水平线
+        self.bounding_rect = None  # 缓存的包围盒，参数改变后由geometry_changed清除
+
+    def geometry_changed(self) -> None:
+        """图元参数被修改后调用：更新包围盒，并只重绘新旧包围盒的并集所覆盖的区域"""
+        old_rect = self.boundingRect()
+        self.prepareGeometryChange()
+        self.bounding_rect = None
+        if self.scene() is not None:
+            self.scene().update(old_rect.united(self.boundingRect()))
+
+    def item_pixels(self) -> QPolygon:
+        """返回图元的像素点，只有图元类型、算法或参数改变后才重新计算；填充多边形的像素段同时更新到spans中"""
+        key = (self.item_type, self.algorithm, tuple(map(tuple, self.p_list)))
+        if key != self.pixels_key:
+            self.spans = []
+            if self.item_type == 'line':
+                item_pixels = alg.draw_line(self.p_list, self.algorithm)
+            elif self.item_type == 'polygon':
+                item_pixels = alg.draw_polygon(self.p_list, self.algorithm)
+            elif self.item_type == 'ellipse':
+                item_pixels = alg.draw_ellipse(self.p_list)
+            elif self.item_type == 'curve':
+                item_pixels = alg.draw_curve(self.p_list, self.algorithm)
+            elif self.item_type == 'fill':
+                item_pixels = []
+                self.spans = alg.fill_polygon(self.p_list, self.algorithm)
+            else:
+                item_pixels = []
+            self.pixels = QPolygon()
+            self.pixel_list = item_pixels or []
+            self.pixel_set = None
+            if item_pixels:
+                self.pixels.setPoints([c for p in item_pixels for c in p])
+            self.span_lines = [QLine(x_start, y, x_end, y) for y, x_start, x_end in self.spans]
+            self.pixels_key = key
+        return self.pixels
+
+    def hit(self, x: int, y: int, radius: int) -> bool:
+        """判断以(x, y)为中心、半径为radius的正方形内是否有图元的像素"""
+        self.item_pixels()
+        if self.pixel_set is None:
+            self.pixel_set = set(map(tuple, self.pixel_list))
+        pixel_set = self.pixel_set
+        if any(y - radius <= sy <= y + radius and x_start <= x + radius and x - radius <= x_end
+               for sy, x_start, x_end in self.spans):
+            return True
+        return any((px, py) in pixel_set
+                   for px in range(x - radius, x + radius + 1) for py in range(y - radius, y + radius + 1))
 
     def paint(self, painter: QPainter, option: QStyleOptionGraphicsItem, widget: Optional[QWidget] = ...) -> None:
         painter.setPen(self.color)
-        if self.item_type == 'line':
-            item_pixels = alg.draw_line(self.p_list, self.algorithm)
-            for p in item_pixels:
-                painter.drawPoint(*p)
-            if self.selected:
-                painter.setPen(QColor(255, 0, 0))
-                painter.drawRect(self.boundingRect())
-        elif self.item_type == 'polygon':
-            item_pixels = alg.draw_polygon(self.p_list, self.algorithm)
-            for p in item_pixels:
-                painter.drawPoint(*p)
-            if self.selected:
-                painter.setPen(QColor(255, 0, 0))
-                painter.drawRect(self.boundingRect())
-        elif self.item_type == 'ellipse':
-            item_pixels = alg.draw_ellipse(self.p_list)
-            for p in item_pixels:
-                painter.drawPoint(*p)
-            if self.selected:
-                painter.setPen(QColor(255, 0, 0))
-                painter.drawRect(self.boundingRect())
-        elif self.item_type == 'curve':
-            item_pixels = alg.draw_curve(self.p_list, self.algorithm)
-            for p in item_pixels:
-                painter.drawPoint(*p)
-            if self.selected:
-                painter.setPen(QColor(255, 0, 0))
-                painter.drawRect(self.boundingRect())
+        painter.drawPoints(self.item_pixels())
+        if self.span_lines:
+            painter.drawLines(self.span_lines)
+        if self.selected:
+            painter.setPen(QColor(255, 0, 0))
+            painter.drawRect(self.boundingRect())
 
     def boundingRect(self) -> QRectF:
+        if self.bounding_rect is None:
+            self.bounding_rect = self.compute_bounding_rect()
+        return self.bounding_rect
+
+    def compute_bounding_rect(self) -> QRectF:
         if self.item_type == 'line':
             x0, y0 = self.p_list[0]
             x1, y1 = self.p_list[1]
@@ -268,7 +377,7 @@ class MyItem(QGraphicsItem):
             w = max(x0, x1) - x
             h = max(y0, y1) - y
             return QRectF(x - 1, y - 1, w + 2, h + 2)
-        elif self.item_type == 'polygon':
+        elif self.item_type in ('polygon', 'fill'):
             resx = [x for x, _ in self.p_list]
             resy = [y for _, y in self.p_list]
             x = min(resx)
@@ -330,6 +439,9 @@ class MainWindow(QMainWindow):
         polygon_menu = draw_menu.addMenu('多边形')
         polygon_dda_act = polygon_menu.addAction('DDA')
         polygon_bresenham_act = polygon_menu.addAction('Bresenham')
+        fill_menu = draw_menu.addMenu('填充多边形')
+        fill_even_odd_act = fill_menu.addAction('Even-Odd')
+        fill_non_zero_act = fill_menu.addAction('Non-Zero')
         ellipse_act = draw_menu.addAction('椭圆')
         curve_menu = draw_menu.addMenu('曲线')
         curve_bezier_act = curve_menu.addAction('Bezier')
@@ -352,6 +464,8 @@ class MainWindow(QMainWindow):
         line_bresenham_act.triggered.connect(self.line_bresenham_action)
         polygon_dda_act.triggered.connect(self.polygon_dda_action)
         polygon_bresenham_act.triggered.connect(self.polygon_bresenham_action)
+        fill_even_odd_act.triggered.connect(self.fill_even_odd_action)
+        fill_non_zero_act.triggered.connect(self.fill_non_zero_action)
         ellipse_act.triggered.connect(self.ellipse_action)
         curve_bezier_act.triggered.connect(self.curve_bezier_action)
         curve_b_spline_act.triggered.connect(self.curve_b_spline_action)
@@ -370,6 +484,9 @@ class MainWindow(QMainWindow):
         self.central_widget.setLayout(self.hbox_layout)
         self.setCentralWidget(self.central_widget)
         self.statusBar().showMessage('空闲')
+        self.frame_label = QLabel(self)
+        self.statusBar().addPermanentWidget(self.frame_label)
+        self.canvas_widget.frame_label = self.frame_label
         self.resize(600, 600)
         self.setWindowTitle('CG Demo')
 
@@ -382,7 +499,6 @@ class MainWindow(QMainWindow):
         self.statusBar().showMessage('设置画笔颜色')
         color = QColorDialog.getColor()
         self.canvas_widget.start_set_pen(color)
-        self.scene.update()
 
     def save_canvas_action(self):
         self.statusBar().showMessage('保存画布')
@@ -408,6 +524,14 @@ class MainWindow(QMainWindow):
             self.canvas_widget.selection_changed)  # 在清空QListWidget之前应该把链接上的信号和槽解除链接
         self.list_widget.clear()
         self.list_widget.currentTextChanged.connect(self.canvas_widget.selection_changed)
+        self.canvas_widget.abort_preview()
+        # item_cnt已归零，旧的绘制状态和图元ID作废，需重新选择绘制工具；未完成的变换、裁剪也一并取消
+        self.canvas_widget.status = ''
+        self.canvas_widget.temp_id = ''
+        self.canvas_widget.temp_item = None
+        self.canvas_widget.rotated = self.canvas_widget.scaled = self.canvas_widget.cliped = False
+        self.canvas_widget.clip_list = []
+        self.canvas_widget.spatial_index.clear()
         self.scene.clear()
 
     def line_naive_action(self):
@@ -415,56 +539,60 @@ class MainWindow(QMainWindow):
         self.statusBar().showMessage('Naive算法绘制线段')
         self.list_widget.clearSelection()
         self.canvas_widget.clear_selection()
-        self.scene.update()
 
     def line_dda_action(self):
         self.canvas_widget.start_draw_line('DDA', self.get_id())
         self.statusBar().showMessage('DDA算法绘制线段')
         self.list_widget.clearSelection()
         self.canvas_widget.clear_selection()
-        self.scene.update()
 
     def line_bresenham_action(self):
         self.canvas_widget.start_draw_line('Bresenham', self.get_id())
         self.statusBar().showMessage('Bresenham算法绘制线段')
         self.list_widget.clearSelection()
         self.canvas_widget.clear_selection()
-        self.scene.update()
 
     def polygon_dda_action(self):
         self.canvas_widget.start_draw_polygon('DDA', self.get_id())
         self.statusBar().showMessage('DDA算法绘制多边形')
         self.list_widget.clearSelection()
         self.canvas_widget.clear_selection()
-        self.scene.update()
 
     def polygon_bresenham_action(self):
         self.canvas_widget.start_draw_polygon('Bresenham', self.get_id())
         self.statusBar().showMessage('Bresenham算法绘制多边形')
         self.list_widget.clearSelection()
         self.canvas_widget.clear_selection()
-        self.scene.update()
+
+    def fill_even_odd_action(self):
+        self.canvas_widget.start_fill_polygon('Even-Odd', self.get_id())
+        self.statusBar().showMessage('奇偶规则扫描线填充多边形')
+        self.list_widget.clearSelection()
+        self.canvas_widget.clear_selection()
+
+    def fill_non_zero_action(self):
+        self.canvas_widget.start_fill_polygon('Non-Zero', self.get_id())
+        self.statusBar().showMessage('非零环绕数规则扫描线填充多边形')
+        self.list_widget.clearSelection()
+        self.canvas_widget.clear_selection()
 
     def ellipse_action(self):
         self.canvas_widget.start_draw_ellipse(self.get_id())
         self.statusBar().showMessage('中点圆生成算法绘制椭圆')
         self.list_widget.clearSelection()
         self.canvas_widget.clear_selection()
-        self.scene.update()
 
     def curve_bezier_action(self):
         self.canvas_widget.start_draw_curve('Bezier', self.get_id())
         self.statusBar().showMessage('Bezier算法绘制曲线')
         self.list_widget.clearSelection()
         self.canvas_widget.clear_selection()
-        self.scene.update()
 
     def curve_b_spline_action(self):
         self.canvas_widget.start_draw_curve('B-spline', self.get_id())
         self.statusBar().showMessage('B-spline算法绘制曲线')
         self.list_widget.clearSelection()
         self.canvas_widget.clear_selection()
-        self.scene.update()
 
     def translate_action(self):
         self.statusBar().showMessage('平移变换')
@@ -473,31 +601,26 @@ class MainWindow(QMainWindow):
             y, yok = QInputDialog.getInt(self, '平移', 'y方向平移')
             if yok:
                 self.canvas_widget.start_translate(x, y)
-        self.scene.update()
 
     def rotate_action(self):
         self.statusBar().showMessage('旋转变换')
         r, rok = QInputDialog.getInt(self, '旋转', '旋转角度')
         if rok:
             self.canvas_widget.start_rotate(r)
-        self.scene.update()
 
     def scale_action(self):
         self.statusBar().showMessage('缩放变换')
         s, sok = QInputDialog.getDouble(self, '缩放', '缩放倍数')
         if sok:
             self.canvas_widget.start_scale(s)
-        self.scene.update()
 
     def clip_cohen_sutherland_action(self):
         self.statusBar().showMessage('Cohen-Sutherland算法裁剪线段')
         self.canvas_widget.start_clip('Cohen-Sutherland')
-        self.scene.update()
 
     def clip_liang_barsky_action(self):
         self.statusBar().showMessage('Liang-Barsky算法裁剪线段')
         self.canvas_widget.start_clip('Liang-Barsky')
-        self.scene.update()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,637 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+
+# 命令文件解释器：流式解析命令并通过命令分派表执行，可作为库被cg_cli以外的程序复用
+import gc
+import os
+import shutil
+import tempfile
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain
+import cg_algorithms as alg
+import cg_bmp
+from cg_profile import Profiler
+from cg_scene import SceneStore
+from cg_writer import DEFAULT_COMPRESS_LEVEL, ImageWriter
+import numpy as np
+
+
+# 不短于该长度的水平像素段用一次切片赋值写入画布；更短的段展开为像素点，与其他像素一起用一次花式索引赋值写入
+SPAN_MIN_LENGTH = 64
+
+
+def rasterize(item_type, p_list, algorithm, clip_rect=None):
+    """将图元光栅化为像素坐标数组和水平像素段数组
+
+    :param item_type: (string) 图元类型，'line'、'polygon'、'ellipse'、'curve'、'fill'（填充多边形）
+    :param p_list: (list of list of int: [[x0, y0], [x1, y1], ...]) 图元参数
+    :param algorithm: (string) 绘制使用的算法，填充多边形为填充规则
+    :param clip_rect: (tuple of int: (x_min, y_min, x_max, y_max)) 可选的裁剪矩形，只生成矩形内的像素
+    :return: (tuple of numpy.ndarray: (xs, ys, spans)) 像素点的x坐标数组和y坐标数组，可直接用于画布的花式索引赋值；
+             spans为[N, 3]的水平像素段数组，每行(y, x_start, x_end)，每段用一次切片赋值写入画布。均为int32
+    """
+    # 椭圆和Bresenham线段、多边形可以直接按行生成像素段；其余算法本来就要逐像素计算，生成像素后再用NumPy合并
+    if item_type == 'line' and algorithm == 'Bresenham':
+        spans = alg.draw_line(p_list, algorithm, clip_rect, spans=True)
+    elif item_type == 'polygon' and algorithm == 'Bresenham':
+        spans = alg.draw_polygon(p_list, algorithm, clip_rect, spans=True)
+    elif item_type == 'ellipse':
+        spans = alg.draw_ellipse(p_list, clip_rect, spans=True)
+    elif item_type == 'fill':
+        spans = alg.fill_polygon(p_list, algorithm, clip_rect)
+    else:
+        if item_type == 'line':
+            pixels = alg.draw_line(p_list, algorithm, clip_rect)
+        elif item_type == 'polygon':
+            pixels = alg.draw_polygon(p_list, algorithm, clip_rect)
+        elif item_type == 'curve':
+            pixels = alg.draw_curve(p_list, algorithm, clip_rect=clip_rect)
+        else:
+            pixels = []
+        return _split_spans(_pixel_runs(pixels))
+    return _split_spans(np.fromiter(chain.from_iterable(spans), np.int32, 3 * len(spans)).reshape(-1, 3))
+
+
+def _pixel_runs(pixels):
+    """把按生成顺序排列的像素点中同一行上前后相邻（或重合）的连续像素合并为水平像素段，同cg_algorithms.pixel_spans"""
+    coords = np.fromiter(chain.from_iterable(pixels), np.int32, 2 * len(pixels)).reshape(-1, 2)
+    xs, ys = coords[:, 0], coords[:, 1]
+    if len(xs) == 0:
+        return np.zeros((0, 3), np.int32)
+    # 每一步最多移动一格，同一段的像素恰好是从最左到最右的连续像素
+    starts = np.flatnonzero(np.concatenate(([True], (ys[1:] != ys[:-1]) | (np.abs(np.diff(xs)) > 1))))
+    return np.stack([ys[starts], np.minimum.reduceat(xs, starts), np.maximum.reduceat(xs, starts)], 1)
+
+
+def _split_spans(spans):
+    """把[N, 3]的像素段数组分为长段和展开成像素点的短段，返回rasterize的结果"""
+    lengths = spans[:, 2] - spans[:, 1] + 1
+    long = lengths >= SPAN_MIN_LENGTH
+    short, counts = spans[~long], lengths[~long]
+    step = np.arange(int(counts.sum()), dtype=np.int32) - np.repeat(np.cumsum(counts, dtype=np.int32) - counts, counts)
+    return np.repeat(short[:, 1], counts) + step, np.repeat(short[:, 0], counts), spans[long]
+
+
+def paint(canvas, raster, color):
+    """把rasterize的结果以color写入画布（或画布的一部分，此时坐标应已换算为相对坐标）"""
+    xs, ys, spans = raster
+    canvas[ys, xs] = color
+    for y, x_start, x_end in spans.tolist():
+        canvas[y, x_start:x_end + 1] = color
+
+
+def is_translation_invariant(item_type, p_list, algorithm, dx, dy):
+    """判断图元平移(dx, dy)后重新光栅化的结果是否恰好等于原像素整体平移(dx, dy)
+
+    Bresenham算法和多边形填充只有整数运算，平移不变；椭圆的像素相对中心的分布只取决于半径，
+    但中心int((x0 + x1) / 2)向零取整，只有平移前后坐标和的符号不变时才与平移交换；
+    DDA、Naive和曲线的结果依赖浮点运算的舍入，平移后可能相差一个像素，需要重新光栅化
+    """
+    if item_type in ('line', 'polygon'):
+        return algorithm == 'Bresenham'
+    elif item_type == 'fill':
+        return True
+    elif item_type == 'ellipse':
+        (x0, y0), (x1, y1) = p_list
+        return (x0 + x1) * (x0 + x1 + 2 * dx) >= 0 and (y0 + y1) * (y0 + y1 + 2 * dy) >= 0
+    return False
+
+
+def _inside(p_list, clip_rect, dx=0, dy=0):
+    """判断图元平移(dx, dy)后的像素是否一定都在裁剪矩形内：像素不超出控制点包围盒向外一个像素的范围；没有控制点时返回False"""
+    if not p_list:
+        return False
+    x_min, y_min, x_max, y_max = clip_rect
+    xs = [x for x, _ in p_list]
+    ys = [y for _, y in p_list]
+    return (min(xs) + dx > x_min and max(xs) + dx < x_max
+            and min(ys) + dy > y_min and max(ys) + dy < y_max)
+
+
+class RasterCache:
+    """图元光栅化结果的缓存，图元在被平移、旋转、缩放、裁剪或重新绘制之前一直复用上次的像素坐标数组"""
+
+    def __init__(self):
+        self.pixels = {}
+        self.clip_rect = None  # 光栅化时的裁剪矩形，通常为整个画布
+        self.hits = 0
+        self.misses = 0
+        self.offsets = 0
+        self.profiler = None  # 不为None时记录每次光栅化的时间和像素数
+
+    def get(self, item_id, item):
+        """返回图元的rasterize结果，缓存未命中时才读取图元的控制点并光栅化
+
+        :param item_id: (string) 图元ID
+        :param item: (list: [item_type, p_list, algorithm, color, matrix]) Interpreter.item_dict中的图元，
+                     matrix不为None时先把该变换作用到控制点上
+        """
+        pixels = self.pixels.get(item_id)
+        if pixels is None:
+            self.misses += 1
+            p_list, matrix = item[1], item[4]
+            if matrix is not None:
+                p_list = alg.apply_matrix(p_list, matrix)
+            profiler = self.profiler
+            if profiler is None:
+                pixels = self.pixels[item_id] = rasterize(item[0], p_list, item[2], self.clip_rect)
+            else:
+                start = time.perf_counter()
+                pixels = self.pixels[item_id] = rasterize(item[0], p_list, item[2], self.clip_rect)
+                profiler.raster(item_id, item[0], item[2], time.perf_counter() - start, pixels)
+        else:
+            self.hits += 1
+        return pixels
+
+    def invalidate(self, item_id):
+        if item_id in self.pixels:
+            del self.pixels[item_id]
+
+    def translate(self, item_id, item_type, p_list, algorithm, dx, dy):
+        """在图元平移之前调用：结果平移不变时直接平移缓存的像素，否则使缓存失效
+
+        有裁剪矩形时还要求平移前后图元都完整地在矩形内，否则被裁掉的像素会随平移进入或离开矩形
+        """
+        pixels = self.pixels.get(item_id)
+        if pixels is None:
+            return
+        clip_rect = self.clip_rect
+        if is_translation_invariant(item_type, p_list, algorithm, dx, dy) and (
+                clip_rect is None or _inside(p_list, clip_rect) and _inside(p_list, clip_rect, dx, dy)):
+            self.offsets += 1
+            self.pixels[item_id] = (pixels[0] + dx, pixels[1] + dy, pixels[2] + (dy, dx, dx))
+        else:
+            self.invalidate(item_id)
+
+    def clear(self):
+        self.pixels.clear()
+
+    def report(self):
+        total = self.hits + self.misses
+        return 'raster cache: %d hits, %d misses (%.1f%% hit rate), %d translations applied as offsets' % (
+            self.hits, self.misses, 100 * self.hits / total if total else 0, self.offsets)
+
+
+def _parse_points(tokens):
+    """解析'id x0 y0 x1 y1 ... algorithm'形式的参数"""
+    values = map(int, tokens[2:2 + (len(tokens) - 3) // 2 * 2])
+    return tokens[1], list(map(list, zip(values, values))), tokens[-1]
+
+
+def _parse_ellipse(tokens):
+    x0, y0, x1, y1 = int(tokens[2]), int(tokens[3]), int(tokens[4]), int(tokens[5])
+    return tokens[1], [[min(x0, x1), max(y0, y1)], [max(x0, x1), min(y0, y1)]]
+
+
+# 命令分派表：命令名 -> 参数解析函数，解析函数把按空格切分后的命令转换为对应Interpreter方法的参数元组
+PARSERS = {
+    'resetCanvas': lambda t: (int(t[1]), int(t[2])),
+    'saveCanvas': lambda t: (t[1],),
+    'setColor': lambda t: (int(t[1]), int(t[2]), int(t[3])),
+    'drawLine': lambda t: (t[1], [[int(t[2]), int(t[3])], [int(t[4]), int(t[5])]], t[6]),
+    'drawPolygon': _parse_points,
+    'drawEllipse': _parse_ellipse,
+    'drawCurve': _parse_points,
+    'fillPolygon': _parse_points,
+    'clip': lambda t: (t[1], int(t[2]), int(t[3]), int(t[4]), int(t[5]), t[6]),
+    'translate': lambda t: (t[1], int(t[2]), int(t[3])),
+    'rotate': lambda t: (t[1], int(t[2]), int(t[3]), int(t[4])),
+    'scale': lambda t: (t[1], int(t[2]), int(t[3]), float(t[4])),
+}
+
+
+def parse_commands(stream):
+    """流式解析命令，逐条生成(命令名, 参数元组)，不认识的命令和空行被忽略
+
+    :param stream: (iterable of str) 命令文本的行，例如打开的文件
+    :return: (generator of tuple: (name, args)) 命令名及解析后的参数
+    """
+    parsers = PARSERS
+    for line in stream:
+        tokens = line.split()
+        if tokens and tokens[0] in parsers:
+            yield tokens[0], parsers[tokens[0]](tokens)
+
+
+class Interpreter:
+    """命令解释器，保存当前画布的图元及画笔等状态"""
+
+    def __init__(self, output_dir, tile_size=0, lazy_transforms=False, compact_scene=False, profile=False,
+                 image_format='bmp', writer_threads=0, writer_queue=4, compress_level=DEFAULT_COMPRESS_LEVEL):
+        """
+
+        :param output_dir: 输出目录
+        :param tile_size: 大于0时按每tile_size行一个条带分块渲染，直接写入内存映射的BMP文件，不在内存中分配整个画布
+        :param lazy_transforms: 为True时平移、旋转、缩放只累积到图元的变换矩阵中，光栅化时才作用到原始控制点上并取整，
+                                不会因为每次变换后取整而累积误差；为False时与原来一样每次变换后立即修改控制点并取整
+        :param compact_scene: 为True时图元保存在按列存储的cg_scene.SceneStore中，每个图元的内存开销小得多，适合图元极多的场景
+        :param profile: 为True时在profiler中记录各类命令的解析和执行时间、各算法的光栅化时间和像素数及每次保存图像的时间
+        :param image_format: saveCanvas保存的图像格式，见cg_writer.WRITERS；分块渲染只能保存BMP
+        :param writer_threads: 大于0时由这么多个后台线程编码并写入图像，saveCanvas不等待写完；执行结束后需调用close
+        :param writer_queue: 后台写入时最多等待写入的图像数，超过时saveCanvas阻塞
+        :param compress_level: PNG的压缩级别，0到9
+        """
+        if tile_size > 0 and image_format == 'png':
+            raise ValueError('tiled rendering writes BMP files directly and cannot save PNG')
+        self.output_dir = output_dir
+        self.tile_size = tile_size
+        self.lazy_transforms = lazy_transforms
+        self.compact_scene = compact_scene
+        self.item_dict = self._empty_scene()  # 图元ID -> [图元类型, 控制点, 算法, 颜色, 累积的变换矩阵（未使用延迟变换时为None）]
+        self.raster_cache = RasterCache()
+        self.profiler = Profiler() if profile else None
+        self.writer = ImageWriter(image_format, writer_threads, writer_queue, compress_level)
+        self.raster_cache.profiler = self.profiler
+        self.pen_color = (0, 0, 0)
+        self.width = 0
+        self.height = 0
+        self.commands = 0  # 已执行的命令条数
+        self.seconds = 0.0  # 执行命令（含解析）所用的时间
+        self.handlers = {
+            'resetCanvas': self.reset_canvas,
+            'saveCanvas': self.save_canvas,
+            'setColor': self.set_color,
+            'drawLine': self.draw_line,
+            'drawPolygon': self.draw_polygon,
+            'drawEllipse': self.draw_ellipse,
+            'drawCurve': self.draw_curve,
+            'fillPolygon': self.fill_polygon,
+            'clip': self.clip,
+            'translate': self.translate,
+            'rotate': self.rotate,
+            'scale': self.scale,
+        }
+
+    def execute(self, commands):
+        """依次执行命令
+
+        :param commands: (iterable of tuple: (name, args)) parse_commands生成的命令
+        """
+        # 场景中的图元都是不含循环引用的列表，由引用计数回收；执行期间暂停循环垃圾回收，
+        # 否则每创建几百个对象就要扫描一次新对象，场景越大完整回收越慢，约占解析和执行时间的一半
+        enabled = gc.isenabled()
+        gc.disable()
+        try:
+            if self.profiler is not None:
+                self._execute_profiled(commands)
+                return
+            handlers = self.handlers
+            start = time.perf_counter()
+            count = 0
+            for count, (name, args) in enumerate(commands, 1):
+                handlers[name](*args)
+            self.commands += count
+            self.seconds += time.perf_counter() - start
+        finally:
+            if enabled:
+                gc.enable()
+
+    def _execute_profiled(self, commands):
+        """同execute，并分别记录每条命令的解析时间（从命令流中取出该命令所用的时间）和执行时间"""
+        handlers = self.handlers
+        profiler = self.profiler
+        clock = time.perf_counter
+        commands = iter(commands)
+        start = clock()
+        count = 0
+        while True:
+            before_parse = clock()
+            try:
+                name, args = next(commands)
+            except StopIteration:
+                break
+            before_execute = clock()
+            handlers[name](*args)
+            profiler.command(name, before_execute - before_parse, clock() - before_execute)
+            count += 1
+        self.commands += count
+        self.seconds += clock() - start
+
+    def throughput(self):
+        return self.commands / self.seconds if self.seconds else 0.0
+
+    def render(self):
+        """按图元的插入顺序合成当前画布
+
+        :return: (numpy.ndarray: [height, width, 3]) 画布
+        """
+        canvas = np.full([self.height, self.width, 3], 255, np.uint8)
+        for item_id, item in self.item_dict.items():
+            paint(canvas, self.raster_cache.get(item_id, item), item[3])
+        return canvas
+
+    def reset_canvas(self, width, height):
+        self.width = width
+        self.height = height
+        self.item_dict = self._empty_scene()
+        self.raster_cache.clear()
+        # 只光栅化画布内的像素，画布外的部分不再计算，负坐标也不会按NumPy下标的语义绕回到画布另一侧
+        self.raster_cache.clip_rect = (0, 0, width - 1, height - 1)
+
+    def _empty_scene(self):
+        return SceneStore() if self.compact_scene else {}
+
+    def render_tiled(self, path):
+        """分块渲染画布并直接写入内存映射的BMP文件，结果与render后用PIL保存的文件逐字节相同
+
+        画布按tile_size行分为若干条带，每个条带在内存中合成后写入文件。先按控制点的纵向范围把图元分到与之相交的条带中，
+        每个条带只处理分到其中的图元，以条带为裁剪矩形重新光栅化，只生成条带内的像素，不经过光栅化缓存，
+        也不保留整个场景的光栅化结果；除各条带的图元序号外，常驻内存只有一个条带的缓冲区、一个图元在一个条带内的像素
+        和一个条带的文件映射
+
+        :param path: (string) BMP文件路径
+        """
+        width, height, size = self.width, self.height, self.tile_size
+        profiler = self.profiler
+        ids = []
+        bins = [[] for _ in range(0, height, size)]  # 条带序号 -> 与之相交的图元在ids中的序号，按插入顺序
+        for item_id, item in self.item_dict.items():
+            p_list = self.points(item_id)
+            if profiler is not None:
+                profiler.item_pixels[item_id] = 0
+            if not p_list:
+                continue
+            # 图元的像素不超出控制点包围盒向外一个像素的范围（曲线在控制点凸包内，椭圆在两个角点围成的矩形内），多留一个像素的余量
+            ys = [y for _, y in p_list]
+            y_min, y_max = max(min(ys) - 2, 0), min(max(ys) + 2, height - 1)
+            if y_min > y_max:
+                continue
+            index = len(ids)
+            ids.append(item_id)
+            for band_items in bins[y_min // size:y_max // size + 1]:
+                band_items.append(index)
+        cg_bmp.create_bmp(path, width, height)
+        band = np.empty([size, width, 3], np.uint8)
+        for top, band_items in zip(range(0, height, size), bins):
+            # 每次只映射一个条带，写完即解除映射
+            rows = min(size, height - top)
+            clip_rect = (0, top, width - 1, top + rows - 1)
+            # 条带缓冲区直接按BGR顺序合成，写入文件时只需把行倒过来
+            canvas = band[:rows]
+            canvas.fill(255)
+            for index in band_items:
+                item_id = ids[index]
+                item = self.item_dict[item_id]
+                p_list = item[1] if item[4] is None else alg.apply_matrix(item[1], item[4])
+                start = time.perf_counter() if profiler is not None else 0.0
+                xs, ys, spans = rasterize(item[0], p_list, item[2], clip_rect)
+                if profiler is not None:
+                    profiler.raster(item_id, item[0], item[2], time.perf_counter() - start, (xs, ys, spans), part=True)
+                paint(canvas, (xs, ys - top, spans - (top, 0, 0)), item[3][::-1])
+            mm = cg_bmp.map_bmp_rows(path, width, height, top, rows)
+            mm[::-1, :width * 3] = canvas.reshape(rows, -1)
+            mm.flush()
+            del mm
+
+    def save_canvas(self, save_name):
+        path = os.path.join(self.output_dir, save_name + self.writer.extension)
+        if self.profiler is not None:
+            self._save_canvas_profiled(save_name, path)
+        elif self.tile_size > 0:
+            self.render_tiled(path)
+        else:
+            self.writer.write(path, self.render())
+
+    def _save_canvas_profiled(self, save_name, path):
+        """同save_canvas，并记录其中光栅化、写画布和编码保存各自的时间；分块渲染时写画布和写文件交织在一起，全部计入编码保存；
+        后台写入时编码保存的时间只是提交图像（队列满时包括等待）的时间"""
+        profiler = self.profiler
+        raster_before = profiler.raster_seconds
+        start = time.perf_counter()
+        if self.tile_size > 0:
+            self.render_tiled(path)
+            raster_seconds = profiler.raster_seconds - raster_before
+            profiler.save(save_name, raster_seconds, 0.0, time.perf_counter() - start - raster_seconds)
+            return
+        canvas = self.render()
+        rendered = time.perf_counter()
+        self.writer.write(path, canvas)
+        raster_seconds = profiler.raster_seconds - raster_before
+        profiler.save(save_name, raster_seconds, rendered - start - raster_seconds, time.perf_counter() - rendered)
+
+    def close(self):
+        """等待后台写入的图像全部写完"""
+        self.writer.close()
+
+    def set_color(self, r, g, b):
+        self.pen_color = (r, g, b)
+
+    def _add_item(self, item_id, item_type, p_list, algorithm):
+        self.raster_cache.invalidate(item_id)
+        self.item_dict[item_id] = [item_type, p_list, algorithm, self.pen_color, None]
+
+    def draw_line(self, item_id, p_list, algorithm):
+        self._add_item(item_id, 'line', p_list, algorithm)
+
+    def draw_polygon(self, item_id, p_list, algorithm):
+        self._add_item(item_id, 'polygon', p_list, algorithm)
+
+    def draw_ellipse(self, item_id, p_list):
+        self._add_item(item_id, 'ellipse', p_list, 'none')
+
+    def draw_curve(self, item_id, p_list, algorithm):
+        self._add_item(item_id, 'curve', p_list, algorithm)
+
+    def fill_polygon(self, item_id, p_list, rule):
+        self._add_item(item_id, 'fill', p_list, rule)
+
+    def points(self, item_id):
+        """返回图元当前的控制点，延迟变换模式下由原始控制点和累积的变换矩阵求出"""
+        item = self.item_dict[item_id]
+        return item[1] if item[4] is None else alg.apply_matrix(item[1], item[4])
+
+    def clip(self, item_id, x_min, y_min, x_max, y_max, algorithm):
+        item = self.item_dict[item_id]
+        self.raster_cache.invalidate(item_id)
+        # 裁剪不是仿射变换，先求出当前的控制点再裁剪，裁剪结果作为新的原始控制点
+        item[1] = alg.clip(self.points(item_id), x_min, y_min, x_max, y_max, algorithm)
+        item[4] = None
+
+    def translate(self, item_id, dx, dy):
+        if self.lazy_transforms:
+            self._transform(item_id, alg.translate_matrix(dx, dy), (dx, dy))
+            return
+        item = self.item_dict[item_id]
+        self.raster_cache.translate(item_id, item[0], item[1], item[2], dx, dy)
+        item[1] = alg.translate(item[1], dx, dy)
+
+    def rotate(self, item_id, x, y, r):
+        if self.lazy_transforms:
+            self._transform(item_id, alg.rotate_matrix(x, y, r))
+            return
+        item = self.item_dict[item_id]
+        self.raster_cache.invalidate(item_id)
+        item[1] = alg.rotate(item[1], x, y, r)
+
+    def scale(self, item_id, x, y, s):
+        if self.lazy_transforms:
+            self._transform(item_id, alg.scale_matrix(x, y, s))
+            return
+        item = self.item_dict[item_id]
+        self.raster_cache.invalidate(item_id)
+        item[1] = alg.scale(item[1], x, y, s)
+
+    def translate_items(self, dx, dy, ids=None, item_type=None, algorithm=None):
+        """批量平移选中的图元，选择条件同cg_scene.SceneStore.select，控制点为None的图元不被选中
+
+        compact_scene且未使用延迟变换时直接对坐标列做向量化平移，其余情况逐个调用translate；
+        两种方式的结果和对光栅化缓存的处理都与逐个变换相同，不应绕过解释器直接调用SceneStore的批量变换
+        """
+        self._transform_items('translate', (dx, dy), ids, item_type, algorithm)
+
+    def rotate_items(self, x, y, r, ids=None, item_type=None, algorithm=None):
+        """批量旋转选中的图元，参数同rotate和translate_items"""
+        self._transform_items('rotate', (x, y, r), ids, item_type, algorithm)
+
+    def scale_items(self, x, y, s, ids=None, item_type=None, algorithm=None):
+        """批量缩放选中的图元，参数同scale和translate_items"""
+        self._transform_items('scale', (x, y, s), ids, item_type, algorithm)
+
+    def _transform_items(self, transform, args, ids, item_type, algorithm):
+        if not self.compact_scene or self.lazy_transforms:
+            method = getattr(self, transform)
+            for item_id in self._select_ids(ids, item_type, algorithm):
+                method(item_id, *args)
+            return
+        store, cache = self.item_dict, self.raster_cache
+        rows = store.select(ids, item_type, algorithm)
+        if cache.pixels:
+            # 与逐个变换相同：平移时按RasterCache.translate的规则平移或丢弃缓存，旋转、缩放时使缓存失效
+            for row in rows.tolist():
+                item_id = store.name(row)
+                if item_id not in cache.pixels:
+                    continue
+                if transform == 'translate':
+                    item = store[item_id]
+                    cache.translate(item_id, item[0], item[1], item[2], *args)
+                else:
+                    cache.invalidate(item_id)
+        getattr(store, transform)(rows, *args)
+
+    def _select_ids(self, ids, item_type, algorithm):
+        """按插入顺序返回选中的图元ID，选择条件同translate_items"""
+        items = self.item_dict
+        if self.compact_scene:
+            return [items.name(row) for row in items.select(ids, item_type, algorithm).tolist()]
+        return [item_id for item_id in (items if ids is None else ids)
+                if items[item_id][1] is not None and (item_type is None or items[item_id][0] == item_type)
+                and (algorithm is None or items[item_id][2] == algorithm)]
+
+    def _transform(self, item_id, matrix, shift=None):
+        """延迟变换：把matrix累积到图元的变换矩阵上
+
+        平移(shift)前图元已有缓存的像素时，只有取整后的控制点恰好整体移动shift，才按RasterCache.translate的规则平移缓存
+        """
+        item = self.item_dict[item_id]
+        before = self.points(item_id) if shift is not None and item_id in self.raster_cache.pixels else None
+        item[4] = alg.compose(matrix, item[4] or alg.IDENTITY)
+        if before is not None:
+            dx, dy = shift
+            if self.points(item_id) == [[x + dx, y + dy] for x, y in before]:
+                self.raster_cache.translate(item_id, item[0], before, item[2], dx, dy)
+                return
+        self.raster_cache.invalidate(item_id)
+
+
+def run(stream, output_dir, **options):
+    """执行命令流，图像保存到output_dir中
+
+    :param stream: (iterable of str) 命令文本的行，例如打开的文件；逐行读取，内存占用与命令条数无关
+    :param output_dir: (string) 输出目录，不存在时自动创建
+    :param options: 传给Interpreter的其他参数，如tile_size、lazy_transforms、compact_scene、profile
+    :return: (Interpreter) 执行结束后的解释器，可从中读取场景状态及命令条数、吞吐量等统计
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    interpreter = Interpreter(output_dir, **options)
+    try:
+        interpreter.execute(parse_commands(stream))
+    finally:
+        interpreter.close()
+    return interpreter
+
+
+def split_segments(stream):
+    """按resetCanvas命令把命令流切分为互相独立的片段
+
+    resetCanvas不会重置画笔颜色，因此除第一个片段外，每个片段开头先补上此前最后一条setColor命令（如果有）
+
+    :param stream: (iterable of str) 命令文本的行
+    :return: (generator of list of str) 各片段的命令行
+    """
+    segment = []
+    pen = None
+    for line in stream:
+        command = line.split(None, 1)[:1]
+        if segment and command == ['resetCanvas']:
+            yield segment
+            segment = [pen] if pen is not None else []
+        elif command == ['setColor']:
+            pen = line
+        segment.append(line)
+    if segment:
+        yield segment
+
+
+def _run_segment(lines, output_dir, options):
+    """在进程池中执行一个片段，图像先保存到output_dir下的临时目录，由主进程按片段顺序移入output_dir
+
+    只返回缓存的命中统计，缓存的像素数组不传回主进程
+    """
+    temp_dir = tempfile.mkdtemp(prefix='.segment-', dir=output_dir)
+    try:
+        interpreter = run(lines, temp_dir, **options)
+    except BaseException:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        raise
+    cache = interpreter.raster_cache
+    return temp_dir, interpreter.commands, (cache.hits, cache.misses, cache.offsets), interpreter.profiler
+
+
+def run_parallel(stream, output_dir, jobs, **options):
+    """用jobs个进程并行执行命令流中由resetCanvas分隔的各个片段，输出与run完全相同
+
+    各片段的图像按片段顺序移入output_dir，因此不同片段保存同名图像时，与串行执行一样保留最后一个片段的结果；
+    同时在执行的片段数不超过2 * jobs，内存占用不随命令文件增大
+
+    :param stream: (iterable of str) 命令文本的行
+    :param output_dir: (string) 输出目录，不存在时自动创建
+    :param jobs: (int) 进程数
+    :param options: 传给Interpreter的其他参数，如tile_size、lazy_transforms、compact_scene、profile
+    :return: (Interpreter) 汇总了各片段命令条数、缓存统计及剖析结果的解释器，seconds为总的墙钟时间
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    summary = Interpreter(output_dir, profile=options.get('profile', False))
+    start = time.perf_counter()
+    pending = deque()
+
+    def collect():
+        temp_dir, commands, (hits, misses, offsets), profiler = pending.popleft().result()
+        for name in os.listdir(temp_dir):
+            os.replace(os.path.join(temp_dir, name), os.path.join(output_dir, name))
+        shutil.rmtree(temp_dir)
+        summary.commands += commands
+        summary.raster_cache.hits += hits
+        summary.raster_cache.misses += misses
+        summary.raster_cache.offsets += offsets
+        if profiler is not None:
+            summary.profiler.merge(profiler)
+
+    with ProcessPoolExecutor(jobs) as executor:
+        try:
+            for segment in split_segments(stream):
+                pending.append(executor.submit(_run_segment, segment, output_dir, options))
+                if len(pending) > 2 * jobs:
+                    collect()
+            while pending:
+                collect()
+        finally:
+            # 某个片段出错时，取消还未开始的片段，并删除其余已执行完的片段留在output_dir中的临时目录
+            for future in pending:
+                future.cancel()
+            for future in pending:
+                if not future.cancelled() and future.exception() is None:
+                    shutil.rmtree(future.result()[0], ignore_errors=True)
+    summary.seconds = time.perf_counter() - start
+    return summary
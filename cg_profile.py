@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+
+# 命令执行的性能剖析：按命令类型统计解析和执行时间，按图元类型和算法统计光栅化时间和像素数，
+# 记录每个图元的像素数和每次saveCanvas中光栅化、写画布、编码保存各自的时间
+import json
+
+TOP_ITEMS = 10  # 文字报告中列出像素最多的图元个数
+
+
+class Profiler:
+    """性能剖析的计数器，由Interpreter在profile=True时创建并更新，不剖析时解释器中只多一次None判断"""
+
+    def __init__(self):
+        self.commands = {}  # 命令名 -> [调用次数, 解析时间, 执行时间]
+        self.rasters = {}  # '图元类型/算法' -> [光栅化次数, 时间, 像素数]
+        self.item_pixels = {}  # 图元ID -> 最近一次光栅化得到的像素数
+        self.saves = []  # 每次saveCanvas：{'name', 'raster', 'paint', 'encode'}，时间以秒计
+        self.raster_seconds = 0.0  # 累计的光栅化时间，用于从渲染时间中扣除光栅化部分
+
+    def command(self, name, parse_seconds, execute_seconds):
+        record = self.commands.get(name)
+        if record is None:
+            record = self.commands[name] = [0, 0.0, 0.0]
+        record[0] += 1
+        record[1] += parse_seconds
+        record[2] += execute_seconds
+
+    def raster(self, item_id, item_type, algorithm, seconds, raster, part=False):
+        """记录一次光栅化
+
+        :param raster: (tuple: (xs, ys, spans)) rasterize的结果
+        :param part: (bool) 为True时raster只是图元的一部分（分块渲染时一个条带内的像素），像素数累加到该图元上
+        """
+        spans = raster[2]
+        pixels = len(raster[0]) + int((spans[:, 2] - spans[:, 1] + 1).sum())
+        key = '%s/%s' % (item_type, algorithm)
+        record = self.rasters.get(key)
+        if record is None:
+            record = self.rasters[key] = [0, 0.0, 0]
+        record[0] += 1
+        record[1] += seconds
+        record[2] += pixels
+        self.item_pixels[item_id] = self.item_pixels.get(item_id, 0) + pixels if part else pixels
+        self.raster_seconds += seconds
+
+    def save(self, name, raster_seconds, paint_seconds, encode_seconds):
+        self.saves.append({'name': name, 'raster': raster_seconds, 'paint': paint_seconds, 'encode': encode_seconds})
+
+    def merge(self, other):
+        """把另一个剖析结果（例如并行执行时某个片段的结果）累加进来"""
+        for name, (calls, parse_seconds, execute_seconds) in other.commands.items():
+            record = self.commands.setdefault(name, [0, 0.0, 0.0])
+            record[0] += calls
+            record[1] += parse_seconds
+            record[2] += execute_seconds
+        for key, (calls, seconds, pixels) in other.rasters.items():
+            record = self.rasters.setdefault(key, [0, 0.0, 0])
+            record[0] += calls
+            record[1] += seconds
+            record[2] += pixels
+        self.item_pixels.update(other.item_pixels)
+        self.saves.extend(other.saves)
+        self.raster_seconds += other.raster_seconds
+
+    def to_dict(self):
+        return {
+            'commands': {name: {'calls': calls, 'parse': parse_seconds, 'execute': execute_seconds}
+                         for name, (calls, parse_seconds, execute_seconds) in self.commands.items()},
+            'rasterization': {key: {'calls': calls, 'seconds': seconds, 'pixels': pixels}
+                              for key, (calls, seconds, pixels) in self.rasters.items()},
+            'item_pixels': self.item_pixels,
+            'saves': self.saves,
+        }
+
+    def dump(self, path):
+        with open(path, 'w') as fp:
+            json.dump(self.to_dict(), fp, indent=2)
+
+    def summary(self):
+        """文字报告；saveCanvas的执行时间包含其中的光栅化、写画布和编码保存"""
+        lines = ['%-16s %10s %12s %12s %12s' % ('command', 'calls', 'parse (s)', 'execute (s)', 'us/call')]
+        for name, (calls, parse_seconds, execute_seconds) in sorted(
+                self.commands.items(), key=lambda kv: -(kv[1][1] + kv[1][2])):
+            lines.append('%-16s %10d %12.3f %12.3f %12.1f' % (
+                name, calls, parse_seconds, execute_seconds, (parse_seconds + execute_seconds) / calls * 1e6))
+        lines.append('')
+        lines.append('%-24s %10s %12s %14s %14s' % ('rasterization', 'calls', 'seconds', 'pixels', 'pixels/s'))
+        for key, (calls, seconds, pixels) in sorted(self.rasters.items(), key=lambda kv: -kv[1][1]):
+            lines.append('%-24s %10d %12.3f %14d %14.0f' % (
+                key, calls, seconds, pixels, pixels / seconds if seconds else 0.0))
+        if self.saves:
+            lines.append('')
+            lines.append('saveCanvas: %d images, raster %.3fs, paint %.3fs, encode %.3fs' % (
+                len(self.saves), sum(s['raster'] for s in self.saves), sum(s['paint'] for s in self.saves),
+                sum(s['encode'] for s in self.saves)))
+            slowest = max(self.saves, key=lambda s: s['raster'] + s['paint'] + s['encode'])
+            lines.append('  slowest: %s (raster %.3fs, paint %.3fs, encode %.3fs)' % (
+                slowest['name'], slowest['raster'], slowest['paint'], slowest['encode']))
+        if self.item_pixels:
+            lines.append('')
+            lines.append('largest items (pixels):')
+            for item_id, pixels in sorted(self.item_pixels.items(), key=lambda kv: -kv[1])[:TOP_ITEMS]:
+                lines.append('  %-22s %14d' % (item_id, pixels))
+        return '\n'.join(lines)
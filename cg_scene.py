@@ -0,0 +1,259 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+
+# 按列存储（structure of arrays）的图元表：所有图元的控制点放在一个连续的坐标数组中，类型、算法、颜色等也各占一个数组，
+# 图元ID拼接保存在一个字节串中并用开放寻址的哈希表查找，每个图元不对应任何Python对象，适合上百万个图元的场景
+import math
+import zlib
+from array import array
+from itertools import chain
+import numpy as np
+
+TYPE_NAMES = ('line', 'polygon', 'ellipse', 'curve', 'fill')
+TYPE_CODES = {name: code for code, name in enumerate(TYPE_NAMES)}
+
+
+class SceneStore:
+    """图元表，可以像Interpreter.item_dict那样按图元ID读写[图元类型, 控制点, 算法, 颜色, 变换矩阵]，
+    也可以对一批图元做向量化的平移、旋转、缩放，取整方式与cg_algorithms中的逐个变换完全相同。批量变换只修改控制点，
+    不会通知Interpreter的光栅化缓存，在解释器中应使用Interpreter.translate_items等方法
+
+    各列用array.array保存，追加时不必重新分配整个数组，批量操作时用numpy.frombuffer得到不复制数据的视图。
+    第i行图元的控制点为coords[2 * start[i]:2 * (start[i] + count[i])]（x、y交替存放）；控制点个数改变时
+    新的控制点追加到末尾，废弃的空间超过一半时整体压缩。count为-1表示控制点为None（例如线段被完全裁剪掉）
+    """
+
+    def __init__(self):
+        self.name_data = bytearray()  # 所有图元ID的UTF-8编码按行号顺序拼接
+        self.name_offsets = array('q', [0])  # 第i行的ID为name_data[name_offsets[i]:name_offsets[i + 1]]
+        self.slots = array('i', [-1]) * 8  # 哈希表，按ID的CRC32开放寻址，保存行号，-1表示空
+        self.start = array('q')
+        self.count = array('i')
+        self.types = array('B')
+        self.algorithms = array('B')
+        self.colors = array('B')  # 每行3个字节：r、g、b
+        self.coords = array('q')
+        self.algorithm_names = []  # 算法编号 -> 算法名
+        self.algorithm_codes = {}
+        self.matrices = {}  # 行号 -> 延迟变换模式下累积的变换矩阵，大多数图元没有
+        self.garbage = 0  # coords中已废弃的控制点个数
+
+    def __len__(self):
+        return len(self.start)
+
+    def __contains__(self, item_id):
+        return self._find(item_id.encode())[1] >= 0
+
+    def __getitem__(self, item_id):
+        row = self._find(item_id.encode())[1]
+        if row < 0:
+            raise KeyError(item_id)
+        return ItemView(self, row)
+
+    def __setitem__(self, item_id, item):
+        """添加图元，或者替换同一ID的图元（保持原来的顺序，与dict相同）
+
+        :param item: (list: [item_type, p_list, algorithm, color, matrix]) 与Interpreter.item_dict的值相同
+        """
+        item_type, p_list, algorithm, color, matrix = item
+        key = item_id.encode()
+        slot, row = self._find(key)
+        if row < 0:
+            row = len(self.start)
+            self.slots[slot] = row
+            self.name_data += key
+            self.name_offsets.append(len(self.name_data))
+            self.start.append(0)
+            self.count.append(0)
+            self.types.append(TYPE_CODES[item_type])
+            self.algorithms.append(self._algorithm_code(algorithm))
+            self.colors.extend(color)
+            if 2 * len(self.start) > len(self.slots):
+                self._rehash()
+        else:
+            self.types[row] = TYPE_CODES[item_type]
+            self.algorithms[row] = self._algorithm_code(algorithm)
+            self.colors[3 * row:3 * row + 3] = array('B', color)
+        self.set_points(row, p_list)
+        self.set_matrix(row, matrix)
+
+    def name(self, row):
+        return self.name_data[self.name_offsets[row]:self.name_offsets[row + 1]].decode()
+
+    def items(self):
+        for row in range(len(self.start)):
+            yield self.name(row), ItemView(self, row)
+
+    def _find(self, key):
+        """返回(哈希表中的位置, 行号)，ID不存在时行号为-1，位置为可以插入的空位"""
+        slots = self.slots
+        mask = len(slots) - 1
+        i = zlib.crc32(key) & mask
+        while True:
+            row = slots[i]
+            if row < 0 or self.name_data[self.name_offsets[row]:self.name_offsets[row + 1]] == key:
+                return i, row
+            i = (i + 1) & mask
+
+    def _rehash(self):
+        self.slots = array('i', [-1]) * (2 * len(self.slots))
+        slots = self.slots
+        mask = len(slots) - 1
+        data, offsets = self.name_data, self.name_offsets
+        for row in range(len(self.start)):
+            i = zlib.crc32(data[offsets[row]:offsets[row + 1]]) & mask
+            while slots[i] >= 0:
+                i = (i + 1) & mask
+            slots[i] = row
+
+    def _algorithm_code(self, algorithm):
+        code = self.algorithm_codes.get(algorithm)
+        if code is None:
+            code = self.algorithm_codes[algorithm] = len(self.algorithm_names)
+            self.algorithm_names.append(algorithm)
+        return code
+
+    def get_points(self, row):
+        count = self.count[row]
+        if count < 0:
+            return None
+        flat = self.coords[2 * self.start[row]:2 * (self.start[row] + count)]
+        return [[flat[i], flat[i + 1]] for i in range(0, 2 * count, 2)]
+
+    def set_points(self, row, p_list):
+        old = self.count[row]
+        if p_list is None:
+            self.garbage += max(old, 0)
+            self.count[row] = -1
+            return
+        flat = array('q', chain.from_iterable(p_list))
+        if len(p_list) == old:
+            start = self.start[row]
+            self.coords[2 * start:2 * (start + old)] = flat
+            return
+        self.garbage += max(old, 0)
+        self.count[row] = 0
+        if 2 * self.garbage > len(self.coords) // 2:
+            self.compact()
+        self.start[row] = len(self.coords) // 2
+        self.count[row] = len(p_list)
+        self.coords.extend(flat)
+
+    def compact(self):
+        """去掉坐标数组中废弃的部分，各图元的控制点按行号顺序重新排列"""
+        start, count = self._column(self.start), np.maximum(self._column(self.count), 0)
+        source = _point_indices(start, count)
+        coords = np.frombuffer(self.coords, np.int64).reshape(-1, 2)[source]
+        self.coords = array('q', coords.tobytes())
+        self.start = array('q', (np.cumsum(count) - count).tobytes())
+        self.garbage = 0
+
+    def get_matrix(self, row):
+        return self.matrices.get(row)
+
+    def set_matrix(self, row, matrix):
+        if matrix is None:
+            self.matrices.pop(row, None)
+        else:
+            self.matrices[row] = matrix
+
+    def nbytes(self):
+        """各列及哈希表占用的字节数"""
+        columns = (self.name_offsets, self.slots, self.start, self.count, self.types, self.algorithms, self.colors,
+                   self.coords)
+        return len(self.name_data) + sum(c.itemsize * len(c) for c in columns)
+
+    @staticmethod
+    def _column(column):
+        """列的numpy视图，不复制数据；视图存在期间该列不能增长"""
+        return np.frombuffer(column, column.typecode)
+
+    def select(self, ids=None, item_type=None, algorithm=None):
+        """选出符合条件的图元的行号
+
+        :param ids: (iterable of string) 只在这些ID中选择，None表示所有图元
+        :param item_type: (string) 只选择该类型的图元
+        :param algorithm: (string) 只选择使用该算法的图元
+        :return: (numpy.ndarray of int) 按行号排列的行号数组
+        """
+        if ids is None:
+            rows = np.arange(len(self.start))
+        else:
+            rows = np.sort(np.array([self[item_id].row for item_id in ids], np.int64))
+        mask = self._column(self.count)[rows] >= 0
+        if item_type is not None:
+            mask &= self._column(self.types)[rows] == TYPE_CODES[item_type]
+        if algorithm is not None:
+            mask &= self._column(self.algorithms)[rows] == self.algorithm_codes.get(algorithm, -1)
+        return rows[mask]
+
+    def _selected_points(self, rows):
+        rows = np.asarray(rows, np.int64)
+        if self.matrices and any(int(row) in self.matrices for row in rows):
+            raise ValueError('bulk transforms apply to control points directly and cannot be mixed with lazy matrices')
+        index = _point_indices(self._column(self.start)[rows], np.maximum(self._column(self.count)[rows], 0))
+        return np.frombuffer(self.coords, np.int64).reshape(-1, 2), index
+
+    def translate(self, rows, dx, dy):
+        """平移rows中的所有图元，同cg_algorithms.translate"""
+        coords, index = self._selected_points(rows)
+        coords[index] += (dx, dy)
+
+    def rotate(self, rows, x, y, r):
+        """绕(x, y)顺时针旋转rows中的所有图元r度，同cg_algorithms.rotate"""
+        coords, index = self._selected_points(rows)
+        xi, yi = coords[index, 0], coords[index, 1]
+        r = math.radians(r)
+        cos, sin = math.cos(r), math.sin(r)
+        # 运算顺序与cg_algorithms.rotate相同，浮点结果逐位一致
+        coords[index, 0] = np.trunc(x + (xi - x) * cos - (yi - y) * sin)
+        coords[index, 1] = np.trunc(y + (xi - x) * sin + (yi - y) * cos)
+
+    def scale(self, rows, x, y, s):
+        """以(x, y)为中心把rows中的所有图元缩放s倍，同cg_algorithms.scale"""
+        coords, index = self._selected_points(rows)
+        xi, yi = coords[index, 0], coords[index, 1]
+        coords[index, 0] = np.trunc(x + (xi - x) * s)
+        coords[index, 1] = np.trunc(y + (yi - y) * s)
+
+
+class ItemView:
+    """SceneStore中一行图元的视图，item[0]到item[4]依次为图元类型、控制点、算法、颜色和变换矩阵，
+    读控制点时得到新的列表，需要写回item[1]才会修改图元"""
+
+    __slots__ = ('store', 'row')
+
+    def __init__(self, store, row):
+        self.store = store
+        self.row = row
+
+    def __len__(self):
+        return 5
+
+    def __getitem__(self, key):
+        store, row = self.store, self.row
+        if key == 0:
+            return TYPE_NAMES[store.types[row]]
+        elif key == 1:
+            return store.get_points(row)
+        elif key == 2:
+            return store.algorithm_names[store.algorithms[row]]
+        elif key == 3:
+            return tuple(store.colors[3 * row:3 * row + 3])
+        elif key == 4:
+            return store.get_matrix(row)
+        raise IndexError(key)
+
+    def __setitem__(self, key, value):
+        if key == 1:
+            self.store.set_points(self.row, value)
+        elif key == 4:
+            self.store.set_matrix(self.row, value)
+        else:
+            raise IndexError(key)
+
+
+def _point_indices(start, count):
+    """各图元的控制点在坐标数组中的下标（以点计）按行拼接"""
+    offsets = np.cumsum(count) - count
+    return np.arange(int(count.sum()), dtype=np.int64) - np.repeat(offsets - start, count)
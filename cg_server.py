@@ -0,0 +1,249 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+
+# 常驻的本地渲染服务：通过Unix套接字或本机TCP接收与命令文件相同的命令，每个会话保留自己的场景和光栅化缓存，
+# 省去每次启动cg_cli时导入Python、NumPy、PIL的时间，缓存也不必每次从头建立
+#
+# 协议按行传输（UTF-8），客户端依次发送：
+#   session NAME      可选，切换到名为NAME的会话，不存在时创建；命名会话在连接断开后保留，默认使用本连接独有的匿名会话
+#   命令行...          与命令文件相同，暂存到收到end为止
+#   end [inline]      在当前会话中执行暂存的命令，回复一行JSON；saveCanvas的图像默认写入服务端的会话目录，
+#                     带inline时不写文件，图像以base64编码放在回复中；saveCanvas的图像名只能是文件名，不能含路径
+#   stats             回复一行JSON，包含请求数及延迟的统计
+#   drop              丢弃当前的命名会话，切换回匿名会话
+# 连接断开时匿名会话被丢弃；一行超过LINE_LIMIT字节时回复错误并断开连接
+#
+# 各连接的收发由asyncio并发处理，命令则在同一个执行线程中按请求到达的顺序依次执行：cg_algorithms中的模块级缓存
+# 不是线程安全的，而光栅化主要是Python代码，受GIL限制，多个执行线程也不会更快
+import argparse
+import asyncio
+import base64
+import io
+import json
+import os
+import re
+import signal
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import cg_interpreter
+from cg_client import DEFAULT_PORT
+from cg_writer import DEFAULT_COMPRESS_LEVEL, WRITERS
+from PIL import Image
+
+LINE_LIMIT = 1 << 24  # 单行命令的最大字节数，控制点很多的多边形、曲线也在一行中
+LATENCY_WINDOW = 1024  # 延迟分位数按最近这么多个请求计算
+SESSION_NAME = re.compile(r'^[A-Za-z0-9_][A-Za-z0-9_.-]*$')
+
+
+class _InlineWriter:
+    """代替Interpreter.writer，把图像编码后留在内存中，由服务端放入回复"""
+
+    def __init__(self, image_format, compress_level):
+        self.extension = WRITERS[image_format][0]
+        self.format = 'png' if image_format == 'png' else 'bmp'
+        self.compress_level = compress_level
+        self.images = []
+
+    def write(self, path, canvas):
+        buffer = io.BytesIO()
+        if self.format == 'png':
+            Image.fromarray(canvas).save(buffer, 'png', compress_level=self.compress_level)
+        else:
+            Image.fromarray(canvas).save(buffer, 'bmp')
+        self.images.append({'name': os.path.basename(path), 'data': base64.b64encode(buffer.getvalue()).decode()})
+
+    def close(self):
+        pass
+
+
+class Session:
+    """一个会话：一个Interpreter及其场景和光栅化缓存"""
+
+    def __init__(self, name, output_dir, options):
+        self.name = name
+        self.interpreter = cg_interpreter.Interpreter(output_dir, **options)
+        self.interpreter.handlers['saveCanvas'] = self.save_canvas
+        self.image_format = options.get('image_format', 'bmp')
+        self.compress_level = options.get('compress_level', DEFAULT_COMPRESS_LEVEL)
+
+    def save_canvas(self, save_name):
+        """代替Interpreter.save_canvas：图像名来自客户端，只允许会话目录中的文件名，不能是绝对路径或包含路径分隔符、..，
+        以免写到会话目录之外"""
+        if not save_name or os.path.isabs(save_name) or '/' in save_name or '\\' in save_name or '..' in save_name:
+            raise ValueError('invalid saveCanvas name: %r' % save_name)
+        self.interpreter.save_canvas(save_name)
+
+    def execute(self, lines, inline):
+        """在执行线程中执行一个请求的命令
+
+        :return: (dict) 回复中与执行结果相关的字段，started为开始执行的时刻
+        """
+        started = time.perf_counter()
+        interpreter = self.interpreter
+        commands = interpreter.commands
+        result = {}
+        if inline:
+            writer = interpreter.writer
+            interpreter.writer = _InlineWriter(self.image_format, self.compress_level)
+            try:
+                interpreter.execute(cg_interpreter.parse_commands(lines))
+            finally:
+                result['images'] = interpreter.writer.images
+                interpreter.writer = writer
+        else:
+            os.makedirs(interpreter.output_dir, exist_ok=True)
+            interpreter.execute(cg_interpreter.parse_commands(lines))
+        result.update(commands=interpreter.commands - commands, started=started)
+        return result
+
+
+class RenderServer:
+    """渲染服务，管理会话并统计请求延迟
+
+    :param output_root: (string) 各会话保存图像的根目录，会话NAME的图像写入output_root/NAME
+    :param options: 传给Interpreter的其他参数，如lazy_transforms、compact_scene、image_format、compress_level
+    """
+
+    def __init__(self, output_root, **options):
+        self.output_root = output_root
+        self.options = options
+        self.executor = ThreadPoolExecutor(1)
+        self.sessions = {}  # 命名会话：会话名 -> Session
+        self.anonymous = 0  # 已创建的匿名会话数，用于生成会话名
+        self.requests = 0
+        self.errors = 0
+        self.commands = 0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)  # 最近请求的延迟（秒）：从收到end到回复就绪，包括排队等待执行的时间
+
+    def _new_session(self, name):
+        return Session(name, os.path.join(self.output_root, name), self.options)
+
+    def _anonymous_session(self):
+        self.anonymous += 1
+        return self._new_session('session-%d' % self.anonymous)
+
+    async def handle(self, reader, writer):
+        """处理一个连接"""
+        session = self._anonymous_session()
+        lines = []
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    # 超过LINE_LIMIT的行已无法与后续的行区分，回复错误后断开连接
+                    writer.write(json.dumps({'ok': False, 'error': 'line exceeds %d bytes' % LINE_LIMIT}).encode() + b'\n')
+                    await writer.drain()
+                    break
+                if not line:
+                    break
+                line = line.decode()
+                tokens = line.split()
+                if not tokens or tokens[0] not in ('session', 'end', 'stats', 'drop'):
+                    lines.append(line)
+                    continue
+                if tokens[0] == 'end':
+                    reply = await self.request(session, lines, tokens[1:] == ['inline'])
+                    lines = []
+                elif tokens[0] == 'stats':
+                    reply = self.stats()
+                elif tokens[0] == 'session':
+                    if len(tokens) != 2 or not SESSION_NAME.match(tokens[1]) or tokens[1].startswith('session-'):
+                        reply = {'ok': False, 'error': 'invalid session name'}
+                    else:
+                        if tokens[1] not in self.sessions:
+                            self.sessions[tokens[1]] = self._new_session(tokens[1])
+                        session = self.sessions[tokens[1]]
+                        reply = {'ok': True, 'session': session.name}
+                else:
+                    self.sessions.pop(session.name, None)
+                    session = self._anonymous_session()
+                    reply = {'ok': True, 'session': session.name}
+                writer.write(json.dumps(reply).encode() + b'\n')
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def request(self, session, lines, inline):
+        """执行一个请求，返回回复的JSON对象"""
+        start = time.perf_counter()
+        try:
+            reply = await asyncio.get_running_loop().run_in_executor(self.executor, session.execute, lines, inline)
+            reply['ok'] = True
+            started = reply.pop('started')
+        except Exception as e:
+            # 与cg_cli相同，出错之前的命令已经作用到会话的场景上
+            self.errors += 1
+            reply = {'ok': False, 'error': '%s: %s' % (type(e).__name__, e)}
+            started = start
+        end = time.perf_counter()
+        self.requests += 1
+        self.commands += reply.get('commands', 0)
+        self.latencies.append(end - start)
+        reply.update(session=session.name, wait_ms=(started - start) * 1e3, execute_ms=(end - started) * 1e3,
+                     latency_ms=(end - start) * 1e3)
+        return reply
+
+    def stats(self):
+        latencies = sorted(self.latencies)
+
+        def percentile(p):
+            return latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1e3 if latencies else 0.0
+
+        return {
+            'ok': True,
+            'requests': self.requests,
+            'errors': self.errors,
+            'commands': self.commands,
+            'sessions': sorted(self.sessions),
+            'latency_ms': {
+                'mean': sum(latencies) / len(latencies) * 1e3 if latencies else 0.0,
+                'p50': percentile(0.5),
+                'p90': percentile(0.9),
+                'p99': percentile(0.99),
+                'max': latencies[-1] * 1e3 if latencies else 0.0,
+            },
+        }
+
+    async def serve(self, socket_path=None, host='127.0.0.1', port=DEFAULT_PORT):
+        """在Unix套接字socket_path上（为None时在host:port上）提供服务，直到被取消或收到SIGTERM"""
+        try:
+            asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+        except (NotImplementedError, RuntimeError):
+            pass  # Windows不支持，不在主线程中运行时也无法注册，只能用Ctrl+C结束或取消serve
+        if socket_path is not None:
+            server = await asyncio.start_unix_server(self.handle, socket_path, limit=LINE_LIMIT)
+        else:
+            server = await asyncio.start_server(self.handle, host, port, limit=LINE_LIMIT)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            if socket_path is not None and os.path.exists(socket_path):
+                os.remove(socket_path)
+            self.executor.shutdown(wait=False)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='常驻的本地渲染服务，客户端见cg_client.py')
+    parser.add_argument('output_root', help='各会话保存图像的根目录')
+    parser.add_argument('--socket', metavar='PATH', help='监听Unix套接字；默认监听本机TCP端口')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--lazy-transforms', action='store_true', help='同cg_cli.py')
+    parser.add_argument('--compact-scene', action='store_true', help='同cg_cli.py')
+    parser.add_argument('--format', choices=sorted(WRITERS), default='bmp', help='saveCanvas保存的图像格式')
+    parser.add_argument('--png-level', type=int, default=DEFAULT_COMPRESS_LEVEL, choices=range(10), metavar='0-9',
+                        help='PNG的压缩级别')
+    args = parser.parse_args()
+
+    render_server = RenderServer(args.output_root, lazy_transforms=args.lazy_transforms,
+                                 compact_scene=args.compact_scene, image_format=args.format,
+                                 compress_level=args.png_level)
+    try:
+        asyncio.run(render_server.serve(args.socket, args.host, args.port))
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        pass
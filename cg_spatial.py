@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+
+# 图元包围盒的均匀网格空间索引，用于点选图元和按矩形查询图元
+
+
+class SpatialGrid:
+    """把平面划分为cell_size * cell_size的格子，每个格子记录与之相交的图元包围盒
+
+    包围盒覆盖的格子数超过max_cells的图元（例如被平移到很远或放大很多倍的图元）不登记到格子中，
+    而是放在单独的集合里，每次查询都检查，避免插入时遍历大量格子
+    """
+
+    def __init__(self, cell_size=32, max_cells=4096):
+        self.cell_size = cell_size
+        self.max_cells = max_cells
+        self.cells = {}  # (格子列号, 格子行号) -> 图元ID的集合
+        self.large = set()
+        self.boxes = {}  # 图元ID -> (x_min, y_min, x_max, y_max)
+        self.order = {}  # 图元ID -> 插入序号，序号大的图元在上层
+        self.counter = 0
+
+    def _cell_range(self, x_min, y_min, x_max, y_max):
+        size = self.cell_size
+        return int(x_min // size), int(y_min // size), int(x_max // size), int(y_max // size)
+
+    def insert(self, item_id, box):
+        """插入图元或更新已有图元的包围盒，更新时保持图元原来的上下层次
+
+        :param item_id: (string) 图元ID
+        :param box: (tuple of number: (x_min, y_min, x_max, y_max)) 包围盒
+        """
+        if item_id in self.boxes:
+            self.remove(item_id, keep_order=True)
+        else:
+            self.order[item_id] = self.counter
+            self.counter += 1
+        self.boxes[item_id] = box
+        c0, r0, c1, r1 = self._cell_range(*box)
+        if (c1 - c0 + 1) * (r1 - r0 + 1) > self.max_cells:
+            self.large.add(item_id)
+            return
+        for c in range(c0, c1 + 1):
+            for r in range(r0, r1 + 1):
+                self.cells.setdefault((c, r), set()).add(item_id)
+
+    def remove(self, item_id, keep_order=False):
+        box = self.boxes.pop(item_id, None)
+        if box is None:
+            return
+        if not keep_order:
+            del self.order[item_id]
+        if item_id in self.large:
+            self.large.discard(item_id)
+            return
+        c0, r0, c1, r1 = self._cell_range(*box)
+        for c in range(c0, c1 + 1):
+            for r in range(r0, r1 + 1):
+                cell = self.cells[(c, r)]
+                cell.discard(item_id)
+                if not cell:
+                    del self.cells[(c, r)]
+
+    def clear(self):
+        self.cells.clear()
+        self.large.clear()
+        self.boxes.clear()
+        self.order.clear()
+        self.counter = 0
+
+    def __contains__(self, item_id):
+        return item_id in self.boxes
+
+    def query_rect(self, x_min, y_min, x_max, y_max):
+        """返回包围盒与给定矩形相交的图元ID集合"""
+        c0, r0, c1, r1 = self._cell_range(x_min, y_min, x_max, y_max)
+        result = set()
+        if (c1 - c0 + 1) * (r1 - r0 + 1) > len(self.cells):
+            candidates = set().union(*self.cells.values()) if self.cells else set()
+        else:
+            candidates = set()
+            for c in range(c0, c1 + 1):
+                for r in range(r0, r1 + 1):
+                    candidates |= self.cells.get((c, r), set())
+        for item_id in candidates | self.large:
+            bx0, by0, bx1, by1 = self.boxes[item_id]
+            if bx0 <= x_max and x_min <= bx1 and by0 <= y_max and y_min <= by1:
+                result.add(item_id)
+        return result
+
+    def pick(self, x, y, radius, hit_test):
+        """点选图元：在包围盒与以(x, y)为中心、半径为radius的正方形相交的图元中，从上层到下层依次用hit_test检查
+
+        :param x: (number) 点击位置x坐标
+        :param y: (number) 点击位置y坐标
+        :param radius: (number) 点选容差
+        :param hit_test: (callable: item_id -> bool) 精确判断点击位置是否落在图元上
+        :return: (string or None) 被选中的最上层图元ID
+        """
+        candidates = self.query_rect(x - radius, y - radius, x + radius, y + radius)
+        for item_id in sorted(candidates, key=self.order.__getitem__, reverse=True):
+            if hit_test(item_id):
+                return item_id
+        return None
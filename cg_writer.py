@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+
+# saveCanvas的图像输出：可选的图像格式，以及在后台线程中编码、写文件的写入器，解释器不必等待图像写完就能继续执行命令
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import cg_bmp
+from PIL import Image
+
+DEFAULT_COMPRESS_LEVEL = 6  # PNG的zlib压缩级别，与PIL的默认值相同
+
+
+def _save_bmp(path, canvas, compress_level):
+    Image.fromarray(canvas).save(path, 'bmp')
+
+
+def _save_raw_bmp(path, canvas, compress_level):
+    cg_bmp.write_bmp(path, canvas)
+
+
+def _save_png(path, canvas, compress_level):
+    Image.fromarray(canvas).save(path, 'png', compress_level=compress_level)
+
+
+# 图像格式 -> (文件扩展名, 写入函数(path, canvas, compress_level))
+WRITERS = {
+    'bmp': ('.bmp', _save_bmp),
+    'raw-bmp': ('.bmp', _save_raw_bmp),  # 不经过PIL，文件与'bmp'逐字节相同
+    'png': ('.png', _save_png),
+}
+
+
+class ImageWriter:
+    """把画布写入图像文件
+
+    threads为0时在调用线程中同步写入；大于0时由threads个后台线程编码并写文件，write提交后立即返回。
+    等待写入的图像不超过queue_size个，超过时write阻塞直到有图像写完，以免渲染远快于写盘时画布堆积在内存中。
+    交给write的画布此后不能再被修改（Interpreter.render每次都返回新的画布，不需要复制）
+    """
+
+    def __init__(self, image_format='bmp', threads=0, queue_size=4, compress_level=DEFAULT_COMPRESS_LEVEL):
+        """
+
+        :param image_format: (string) WRITERS中的图像格式
+        :param threads: (int) 后台写入线程数，0表示同步写入
+        :param queue_size: (int) 最多等待写入的图像数（包括正在写入的）
+        :param compress_level: (int) PNG的压缩级别，0到9
+        """
+        if image_format not in WRITERS:
+            raise ValueError('unknown image format %r, expected one of %s' % (image_format, ', '.join(WRITERS)))
+        self.extension, self.save = WRITERS[image_format]
+        self.compress_level = compress_level
+        self.executor = ThreadPoolExecutor(threads) if threads > 0 else None
+        self.slots = threading.BoundedSemaphore(max(queue_size, 1))
+        self.pending = {}  # 文件路径 -> 尚未确认完成的写入
+
+    def write(self, path, canvas):
+        """写入画布，后台写入时出错的异常在之后的write或close中抛出
+
+        :param path: (string) 文件路径
+        :param canvas: (numpy.ndarray: [height, width, 3]) 画布
+        """
+        if self.executor is None:
+            self.save(path, canvas, self.compress_level)
+            return
+        self._collect()
+        previous = self.pending.get(path)
+        if previous is not None:
+            # 同名图像按保存顺序写入，最终保留最后一次的结果
+            previous.result()
+        self.slots.acquire()
+        future = self.executor.submit(self._save, path, canvas)
+        self.pending[path] = future
+
+    def _save(self, path, canvas):
+        try:
+            self.save(path, canvas, self.compress_level)
+        finally:
+            self.slots.release()
+
+    def _collect(self):
+        """移除已完成的写入，并抛出其中的异常"""
+        for path, future in list(self.pending.items()):
+            if future.done():
+                del self.pending[path]
+                future.result()
+
+    def close(self):
+        """等待所有图像写完，抛出后台写入时的第一个异常"""
+        if self.executor is None:
+            return
+        self.executor.shutdown(wait=True)
+        pending, self.pending = self.pending, {}
+        for future in pending.values():
+            future.result()